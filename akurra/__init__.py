@@ -16,6 +16,7 @@ from .locals import *  # noqa
 from .events import EventManager, TickEvent
 from .modules import ModuleLoader
 from .logger import configure_logging
+from .pacing import FramePacer
 
 from .states import StateManager
 from .assets import AssetManager
@@ -47,8 +48,17 @@ class Akurra:
 
     """Base game class."""
 
-    def __init__(self, game, log_level='INFO', debug=False):
-        """Constructor."""
+    def __init__(self, game, log_level='INFO', debug=False, headless=False, frame_pacing=None):
+        """
+        Constructor.
+
+        :param game: Name of the game to run.
+        :param log_level: Log level to use.
+        :param debug: Whether or not to enable debugging.
+        :param headless: Whether or not to run without a real display (e.g. for servers and benchmarks).
+        :param frame_pacing: Frame pacing mode to use, overriding the configured one.
+
+        """
         # Set up container
         global container
         self.container = container = Injector(build_container)
@@ -56,6 +66,7 @@ class Akurra:
         self.game = game
         self.log_level = log_level
         self.debug = debug
+        self.headless = headless
 
         # Load configuration
         cfg_files = [
@@ -67,8 +78,14 @@ class Akurra:
         self.container.binder.bind(Configuration, to=cfg)
 
         self.container.binder.bind(DebugFlag, to=Value('b', self.debug))
+        self.container.binder.bind(HeadlessFlag, to=Value('b', self.headless))
         self.container.binder.bind(Akurra, to=self)
 
+        # Use SDL's dummy drivers in headless mode, so no real display or audio device is needed
+        if self.headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
         # Start pygame (+ audio frequency, size, channels, buffersize)
         pygame.mixer.pre_init(44100, 16, 2, 4096)
         pygame.init()
@@ -96,9 +113,20 @@ class Akurra:
         self.assets = self.container.get(AssetManager)
         self.session = self.container.get(SessionManager)
 
-        self.loop_wait_millis = self.configuration.get('akurra.core.loop_wait_millis', 5)
         self.max_fps = self.configuration.get('akurra.display.max_fps', 60)
 
+        # In headless mode, simulation should be able to run at full speed
+        if self.headless:
+            self.max_fps = self.configuration.get('akurra.headless.max_fps', 0)
+
+        self.pacer = FramePacer(
+            max_fps=self.max_fps,
+            mode=frame_pacing or self.configuration.get('akurra.core.frame_pacing.mode', 'balanced'),
+            spin_millis=self.configuration.get('akurra.core.frame_pacing.spin_millis', 2),
+            history=self.configuration.get('akurra.core.frame_pacing.history', 300)
+        )
+        self.container.binder.bind(FramePacer, to=self.pacer)
+
         # Handle shutdown signals properly
         signal.signal(signal.SIGINT, self.handle_signal)
         signal.signal(signal.SIGTERM, self.handle_signal)
@@ -111,6 +139,7 @@ class Akurra:
         self.shutdown.clear()
 
         self.modules.load()
+        self.assets.start()
         self.entities.start()
         self.modules.start()
 
@@ -123,17 +152,18 @@ class Akurra:
             raise ValueError('No game module named "%s" exists!' % self.game)
 
         while not self.shutdown.is_set():
+            # Wait for the remainder of the frame budget before polling, so input is read right before
+            # the frame which uses it is simulated and rendered
+            delta_time = self.pacer.wait()
+
             # Pump/handle events (both pygame and akurra)
             self.events.poll()
 
-            # Calculate time (in seconds) that has passed since last tick
-            delta_time = self.clock.tick(self.max_fps) / 1000
+            # Keep the display clock ticking without limiting it, since it is used to measure FPS
+            self.clock.tick()
 
-            # Dispatch tick
-            self.events.dispatch(TickEvent(delta_time=delta_time))
-
-            # Wait a bit to lower CPU usage
-            pygame.time.wait(self.loop_wait_millis)
+            # Handle the tick right away instead of queueing it, which would delay it until the next poll
+            self.events.handle(TickEvent(delta_time=delta_time))
 
         self.stop()
 
@@ -142,8 +172,12 @@ class Akurra:
         logger.info('Stopping..')
         self.shutdown.set()
 
+        logger.info('Frame times [p50=%(p50).2fms, p95=%(p95).2fms, p99=%(p99).2fms, cost=%(cost).2fms]',
+                    self.pacer.get_stats())
+
         self.modules.stop()
         self.entities.stop()
+        self.assets.stop()
         self.modules.unload()
 
         self.states.close()
@@ -162,9 +196,13 @@ def main():
                         choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG', 'INSANE'])
     parser.add_argument('-d', '--debug', action='store_true', help='toggle debugging')
     parser.add_argument('-g', '--game', required=True, type=str, help='game to run')
+    parser.add_argument('--headless', action='store_true', help='run without a display (e.g. for benchmarks)')
+    parser.add_argument('--frame-pacing', type=str, default=None, help='set the frame pacing mode',
+                        choices=FramePacer.modes)
     args = parser.parse_args()
 
-    akurra = Akurra(game=args.game, log_level=args.log_level, debug=args.debug)
+    akurra = Akurra(game=args.game, log_level=args.log_level, debug=args.debug, headless=args.headless,
+                    frame_pacing=args.frame_pacing)
     akurra.start()
 
 
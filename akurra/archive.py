@@ -0,0 +1,219 @@
+"""Archive module."""
+import io
+import os
+import sys
+import mmap
+import json
+import struct
+import logging
+import argparse
+import pygame
+
+
+logger = logging.getLogger(__name__)
+
+
+# Magic bytes, format version and index length
+HEADER = struct.Struct('<4sIQ')
+MAGIC = b'AKAR'
+VERSION = 1
+# Blobs are aligned so pre-decoded pixel data can be used without copying
+ALIGNMENT = 64
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tga']
+SOUND_EXTENSIONS = ['.ogg', '.wav']
+
+
+class AssetArchive:
+
+    """
+    Asset archive.
+
+    A single file containing an index followed by the contents of many assets, which is memory-mapped
+    so assets can be read without opening separate files. Entries are stored in one of these formats:
+
+    - file: the original file contents
+    - image: pre-decoded pixels, which can be turned into a surface without decoding
+    - sound: pre-decoded samples, which can only be used if the mixer was initialized with the same settings
+
+    """
+
+    def __init__(self, path):
+        """
+        Constructor.
+
+        :param path: Path to the archive.
+
+        """
+        self.path = path
+
+        # The mapping stays valid after the file is closed, and lives as long as the images and buffers using it
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, index_size = HEADER.unpack_from(self.data)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('"%s" is not a supported asset archive!' % path)
+
+        self.view = memoryview(self.data)
+        self.index = json.loads(bytes(self.view[HEADER.size:HEADER.size + index_size]).decode())
+
+        # Blob offsets are relative to the start of the data, which follows the index
+        self.data_offset = HEADER.size + index_size
+        self.data_offset += -self.data_offset % ALIGNMENT
+
+    def has(self, path):
+        """Return whether or not the archive contains an asset."""
+        return path in self.index
+
+    def get_size(self, path):
+        """Return the size of an asset in the archive, in bytes."""
+        return self.index[path]['size']
+
+    def read(self, path):
+        """Return a read-only buffer with the contents of an asset, without copying it."""
+        entry = self.index[path]
+        offset = self.data_offset + entry['offset']
+
+        return self.view[offset:offset + entry['size']]
+
+    def load_image(self, path):
+        """
+        Return an unconverted image from the archive.
+
+        Pre-decoded images reference the archive's memory, so they should be converted before being modified.
+
+        """
+        entry = self.index[path]
+
+        if entry['format'] == 'image':
+            image = pygame.image.frombuffer(self.read(path), entry['image_size'], entry['pixel_format'])
+
+            if entry.get('colorkey', None):
+                image.set_colorkey(entry['colorkey'])
+
+            return image
+
+        return pygame.image.load(io.BytesIO(self.read(path)), path)
+
+    def load_sound(self, path):
+        """Return a sound from the archive, or None if its pre-decoded samples don't match the mixer settings."""
+        entry = self.index[path]
+
+        if entry['format'] == 'sound':
+            if list(pygame.mixer.get_init()) != entry['mixer']:
+                return None
+
+            return pygame.mixer.Sound(buffer=self.read(path))
+
+        return pygame.mixer.Sound(file=io.BytesIO(self.read(path)))
+
+
+def encode_asset(path, decode_images=True, decode_sounds=False):
+    """
+    Return the index entry and contents of an asset for storing it in an archive.
+
+    :param path: Path to the asset.
+    :param decode_images: Whether or not to store images as pre-decoded pixels.
+    :param decode_sounds: Whether or not to store sounds as pre-decoded samples.
+
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    if decode_images and extension in IMAGE_EXTENSIONS:
+        image = pygame.image.load(path)
+        pixel_format = 'RGBA' if image.get_flags() & pygame.SRCALPHA else 'RGB'
+        entry = {'format': 'image', 'image_size': list(image.get_size()), 'pixel_format': pixel_format}
+
+        # Colorkeys are kept separately, so images convert the same way as when loaded from the original file
+        if image.get_colorkey():
+            entry['colorkey'] = list(image.get_colorkey())
+
+        return [entry, pygame.image.tostring(image, pixel_format)]
+
+    if decode_sounds and extension in SOUND_EXTENSIONS:
+        return [{'format': 'sound', 'mixer': list(pygame.mixer.get_init())}, pygame.mixer.Sound(path).get_raw()]
+
+    with open(path, 'rb') as f:
+        return [{'format': 'file'}, f.read()]
+
+
+def build_archive(source, destination, decode_images=True, decode_sounds=False):
+    """
+    Build an asset archive from a directory of assets and return the amount of assets stored.
+
+    Assets are indexed by their path relative to the source directory. The archive is written to a
+    temporary file first, so a running game never sees a partially written archive.
+    Files which can't be decoded are stored as-is.
+
+    :param source: Directory containing the assets.
+    :param destination: Path to write the archive to.
+    :param decode_images: Whether or not to store images as pre-decoded pixels.
+    :param decode_sounds: Whether or not to store sounds as pre-decoded samples.
+
+    """
+    index = {}
+    blobs = []
+    offset = 0
+
+    for directory, directories, files in os.walk(source):
+        directories.sort()
+
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            key = os.path.relpath(path, source).replace(os.sep, '/')
+
+            try:
+                entry, blob = encode_asset(path, decode_images, decode_sounds)
+            except pygame.error:
+                logger.warning('Unable to decode "%s", storing it as-is', path)
+                entry, blob = encode_asset(path, False, False)
+
+            padding = -offset % ALIGNMENT
+            entry.update(offset=offset + padding, size=len(blob))
+            index[key] = entry
+            blobs += [bytes(padding), blob]
+            offset += padding + len(blob)
+
+    # Blob offsets are relative to the start of the data, which follows the (aligned) index
+    encoded_index = json.dumps(index, sort_keys=True).encode()
+    padding = -(HEADER.size + len(encoded_index)) % ALIGNMENT
+    temporary_path = '%s.%s.tmp' % (destination, os.getpid())
+
+    with open(temporary_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(encoded_index)))
+        f.write(encoded_index)
+        f.write(bytes(padding))
+        [f.write(x) for x in blobs]
+
+    os.replace(temporary_path, destination)
+
+    return len(index)
+
+
+def main():
+    """Build an asset archive from a directory of assets."""
+    parser = argparse.ArgumentParser(description='Pack a directory of assets into a memory-mappable archive.')
+    parser.add_argument('source', type=str, nargs='?', default='assets', help='directory containing the assets')
+    parser.add_argument('-o', '--output', type=str, default='assets.akar', help='path to write the archive to')
+    parser.add_argument('--no-decode-images', action='store_true', help='store images as-is instead of as pixels')
+    parser.add_argument('--decode-sounds', action='store_true',
+                        help='store sounds as samples (these are much larger and depend on the mixer settings)')
+    parser.add_argument('--frequency', type=int, default=44100, help='mixer frequency to decode sounds for')
+    parser.add_argument('--channels', type=int, default=2, help='mixer channels to decode sounds for')
+    args = parser.parse_args()
+
+    if args.decode_sounds:
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+        pygame.mixer.init(frequency=args.frequency, channels=args.channels)
+
+    count = build_archive(args.source, args.output, decode_images=not args.no_decode_images,
+                          decode_sounds=args.decode_sounds)
+
+    sys.stdout.write('Packed %s assets from "%s" into "%s" (%.2fMB)\n' % (
+        count, args.source, args.output, os.path.getsize(args.output) / 1048576))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,476 @@
 """Assets module."""
 import os
+import time
+import queue
 import logging
+import weakref
 import pygame
 import pyscroll
 import pytmx
+import xml.etree.ElementTree as ElementTree
+from pytmx.util_pygame import smart_convert, handle_transformation
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from .locals import *  # noqa
+from .archive import AssetArchive
+from .pixels import PixelCache, get_pixel_cache_key
+from .maps import CompiledMap, CompiledMapCache, compact_tile_layers, get_external_tileset_paths, \
+    get_map_source_paths
+from .events import Event, TickEvent, EventManager
 from .utils import ContainerAware
 
 
 logger = logging.getLogger(__name__)
 
 
+class AssetLoadedEvent(Event):
+
+    """Event for the completion of an asset preload."""
+
+    def __init__(self, kind, path, pending=0, error=None):
+        """
+        Constructor.
+
+        :param kind: Kind of asset which was loaded.
+        :param path: Path of the asset which was loaded.
+        :param pending: Amount of preloads which are still pending.
+        :param error: Error message if the asset failed to load.
+
+        """
+        super().__init__()
+
+        self.kind = kind
+        self.path = path
+        self.pending = pending
+        self.error = error
+
+
+class AssetReloadedEvent(Event):
+
+    """Event for the reloading of an asset after its files changed."""
+
+    def __init__(self, kind, path):
+        """
+        Constructor.
+
+        :param kind: Kind of asset which was reloaded.
+        :param path: Path of the asset which was reloaded.
+
+        """
+        super().__init__()
+
+        self.kind = kind
+        self.path = path
+
+
+class AssetBatch:
+
+    """A batch of assets being preloaded, for tracking progress."""
+
+    def __init__(self, futures):
+        """
+        Constructor.
+
+        :param futures: Futures for the assets in the batch.
+
+        """
+        self.futures = futures
+
+    @property
+    def progress(self):
+        """Return the fraction of assets in the batch which are done loading."""
+        if not self.futures:
+            return 1.0
+
+        return len([x for x in self.futures if x.done()]) / len(self.futures)
+
+    def done(self):
+        """Return whether or not all assets in the batch are done loading."""
+        return all([x.done() for x in self.futures])
+
+
+def create_deferred_image_loader(conversions, load=pygame.image.load):
+    """
+    Create and return a pytmx image loader which doesn't convert tile images.
+
+    Since conversion requires the display, it has to happen on the main thread. Conversion parameters
+    for every tile image are stored in the provided dict, indexed by image id.
+
+    :param conversions: Dict to store conversion parameters in.
+    :param load: Function to load an unconverted image from a path.
+
+    """
+    def image_loader(filename, colorkey, **kwargs):
+        """Return a function for loading tile images from an image file."""
+        if colorkey:
+            colorkey = pygame.Color('#{0}'.format(colorkey))
+
+        pixelalpha = kwargs.get('pixelalpha', True)
+        image = load(filename)
+
+        def load_image(rect=None, flags=None):
+            """Load and return a tile image."""
+            tile = image.subsurface(rect) if rect else image.copy()
+
+            if flags:
+                tile = handle_transformation(tile, flags)
+
+            conversions[id(tile)] = [tile, colorkey, pixelalpha]
+
+            return tile
+
+        return load_image
+
+    return image_loader
+
+
+def get_surface_size(surface):
+    """Return the approximate size of a surface, in bytes."""
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+def get_sound_size(sound):
+    """Return the approximate size of a sound, in bytes."""
+    frequency, size, channels = pygame.mixer.get_init() or (44100, 16, 2)
+
+    return int(sound.get_length() * frequency * channels * abs(size) / 8)
+
+
+def get_tmx_size(tmx):
+    """Return the approximate size of TMX data, in bytes, based on its images and tile layers."""
+    images = sum([get_surface_size(x) for x in set(tmx.images) if x])
+    tiles = sum([x.width * x.height * 8 for x in tmx.layers if hasattr(x, 'data')])
+
+    return images + tiles
+
+
+class TextureAtlas:
+
+    """
+    Texture atlas.
+
+    Packs many small images into a few large surfaces (pages) using shelf packing. Packed images
+    are subsurfaces of a page, so blitting them is a blit from the page using an area rect.
+
+    """
+
+    def __init__(self, page_size=[1024, 1024], padding=1):
+        """
+        Constructor.
+
+        :param page_size: Size of a single page, in pixels.
+        :param padding: Amount of pixels to keep between packed images.
+
+        """
+        self.page_size = page_size
+        self.padding = padding
+
+        self.pages = []
+        # Shelves per page, as [y, height, used width]
+        self.shelves = []
+        # Packed images by key, as subsurfaces of their page
+        self.images = {}
+
+    def get(self, key):
+        """Return a packed image by key, or None if no such image was packed."""
+        return self.images.get(key, None)
+
+    def add(self, key, image, area=None):
+        """
+        Pack an image (or a region of one) and return the packed image.
+
+        Images which don't fit on a page are returned as a separate surface instead.
+
+        :param key: Key to identify the packed image by.
+        :param image: Image to pack.
+        :param area: Region of the image to pack, defaults to the entire image.
+
+        """
+        if key in self.images:
+            return self.images[key]
+
+        area = pygame.Rect(area) if area else image.get_rect()
+        page_index, rect = self.allocate(area.size)
+
+        if page_index is None:
+            surface = pygame.Surface(area.size, flags=pygame.SRCALPHA)
+            surface.blit(image, [0, 0], area)
+
+            return surface
+
+        self.pages[page_index].blit(image, rect, area)
+        self.images[key] = self.pages[page_index].subsurface(rect)
+
+        return self.images[key]
+
+    def allocate(self, size):
+        """Reserve space for an image of a certain size, returning a page index and rect (or None if it won't fit)."""
+        width = size[0] + self.padding
+        height = size[1] + self.padding
+
+        if width > self.page_size[0] or height > self.page_size[1]:
+            return None, None
+
+        for page_index, shelves in enumerate(self.shelves):
+            # Try to fit the image onto an existing shelf first
+            for shelf in shelves:
+                if height <= shelf[1] and shelf[2] + width <= self.page_size[0]:
+                    rect = pygame.Rect([shelf[2], shelf[0]], size)
+                    shelf[2] += width
+
+                    return page_index, rect
+
+            # Otherwise, start a new shelf below the last one
+            y = shelves[-1][0] + shelves[-1][1] if shelves else 0
+
+            if y + height <= self.page_size[1]:
+                shelves.append([y, height, width])
+
+                return page_index, pygame.Rect([0, y], size)
+
+        self.pages.append(pygame.Surface(self.page_size, flags=pygame.SRCALPHA))
+        self.shelves.append([[0, height, width]])
+        logger.debug('Added texture atlas page [pages=%s, size=%s]', len(self.pages), self.page_size)
+
+        return len(self.pages) - 1, pygame.Rect([0, 0], size)
+
+
+class AssetCache:
+
+    """
+    Asset cache.
+
+    Keeps loaded assets around by key, evicting the least recently used ones once
+    the approximate amount of memory used by all cached assets exceeds a budget.
+
+    """
+
+    def __init__(self, memory_budget=256):
+        """
+        Constructor.
+
+        :param memory_budget: Maximum amount of memory to use for cached assets, in MB.
+
+        """
+        self.memory_budget = memory_budget * 1024 * 1024
+
+        # Cached entries by key as [asset, size in bytes], least recent first
+        self.entries = OrderedDict()
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return a cached asset by key, or None if it isn't cached."""
+        entry = self.entries.get(key, None)
+
+        if not entry:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return entry[0]
+
+    def add(self, key, asset, size):
+        """
+        Add an asset to the cache, evicting other assets if needed.
+
+        :param key: Key to cache the asset by.
+        :param asset: Asset to cache.
+        :param size: Approximate size of the asset, in bytes.
+
+        """
+        self.remove(key)
+        self.entries[key] = [asset, size]
+        self.bytes += size
+
+        while self.bytes > self.memory_budget and len(self.entries) > 1:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted[1]
+            self.evictions += 1
+            logger.debug('Evicted asset from cache [key=%s, size=%s]', evicted_key, evicted[1])
+
+    def remove(self, key):
+        """Remove an asset from the cache."""
+        entry = self.entries.pop(key, None)
+
+        if entry:
+            self.bytes -= entry[1]
+
+    def clear(self):
+        """Remove all assets from the cache."""
+        self.entries.clear()
+        self.bytes = 0
+
+    def get_stats(self):
+        """Return statistics about the cache."""
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+def get_image_options(colorkey=None, alpha=False):
+    """Return the loading options for an image, normalized so they can be used as part of a cache key."""
+    return {'colorkey': tuple(colorkey) if colorkey else None, 'alpha': alpha}
+
+
+class AssetManifest(ContainerAware):
+
+    """
+    Asset manifest.
+
+    Computes which assets are needed by entity and skill templates, UI elements and maps, so the
+    assets of a bundle can be loaded in one pass instead of being loaded as they are first used.
+
+    Bundles are configured by name, with each bundle listing the templates, maps, images and
+    sounds it needs. Templates which are spawned by a map are included along with the map.
+
+    """
+
+    def __init__(self, assets):
+        """
+        Constructor.
+
+        :param assets: Asset manager to read assets with.
+
+        """
+        self.configuration = self.container.get(Configuration)
+        self.assets = assets
+
+        self.templates = {}
+        self.templates.update(self.configuration.get('akurra.entities.templates', {}))
+        self.templates.update(self.configuration.get('akurra.skills.templates', {}))
+        self.ui_elements = self.configuration.get('akurra.ui.elements', {})
+        self.bundles = self.configuration.get('akurra.assets.bundles', {})
+
+    def resolve_template(self, template_name):
+        """Return the components of a template, merged with those of its ancestors."""
+        template = self.templates[template_name]
+        components = dict(template.get('components', {}))
+
+        while template.get('parent', None):
+            template = self.templates[template['parent']]
+            components = dict(template.get('components', {}), **components)
+
+        return components
+
+    def get_template_assets(self, template_name):
+        """Return the assets needed by an entity or skill template."""
+        sprite = self.resolve_template(template_name).get('sprite', None) or {}
+        assets = []
+
+        if sprite.get('image', None):
+            assets.append(['image', sprite['image'], get_image_options(alpha=True)])
+        else:
+            for animation in sprite.get('animations', []):
+                paths = animation['sprite_sheet']
+                paths = paths if type(paths) is list else [paths]
+                assets += [['image', x, get_image_options(alpha=True)] for x in paths]
+
+        return assets
+
+    def get_ui_assets(self):
+        """Return the assets needed by UI elements."""
+        return [['image', x['image'], get_image_options(alpha=True)] for x in self.ui_elements.values()
+                if x.get('image', None)]
+
+    def get_map_dependencies(self, asset_path):
+        """
+        Return the tileset images and spawned templates of a map, without loading it.
+
+        Tileset images are returned as paths relative to the working directory, since they are
+        loaded along with the map rather than as separate assets.
+
+        :param asset_path: Relative path of the map.
+
+        """
+        path = self.assets.get_path(asset_path)
+        root = self.assets.parse_xml(path)
+        tilesets = []
+        templates = []
+
+        for tileset in root.iter('tileset'):
+            directory = os.path.dirname(path)
+
+            # External tilesets are stored in a separate file, relative to which their images are
+            if tileset.get('source', None):
+                tileset_path = os.path.join(directory, tileset.get('source'))
+                tileset = self.assets.parse_xml(tileset_path)
+                directory = os.path.dirname(tileset_path)
+
+            tilesets += [os.path.normpath(os.path.join(directory, x.get('source'))) for x in tileset.iter('image')]
+
+        for o in root.iter('object'):
+            properties = {x.get('name'): x.get('value') for x in o.iter('property')}
+
+            if properties.get('spawn', 'false') == 'true':
+                templates += properties.get('spawn_templates', '').split(';')
+
+        return [tilesets, templates]
+
+    def get_bundle(self, name):
+        """
+        Return the assets of a bundle as a list of [kind, asset path, options] entries.
+
+        :param name: Name of the bundle.
+
+        """
+        bundle = self.bundles[name]
+        templates = list(bundle.get('templates', []))
+        assets = []
+
+        for path in bundle.get('maps', []):
+            assets.append(['map', path, {}])
+            templates += self.get_map_dependencies(path)[1]
+
+        for template_name in templates:
+            assets += self.get_template_assets(template_name)
+
+        if bundle.get('ui', False):
+            assets += self.get_ui_assets()
+
+        assets += [['image', x, get_image_options(alpha=True)] for x in bundle.get('images', [])]
+        assets += [['sound', x, {}] for x in bundle.get('sounds', [])]
+
+        # Assets can be needed by multiple templates, but only need to be loaded once
+        unique = OrderedDict()
+
+        for kind, path, options in assets:
+            unique[(kind, path) + tuple(sorted(options.items()))] = [kind, path, options]
+
+        return list(unique.values())
+
+    def get_bundle_files(self, name):
+        """Return the paths of all files which are read when loading a bundle."""
+        files = []
+
+        for kind, path, options in self.get_bundle(name):
+            files.append(self.assets.get_path(path))
+
+            if kind in ['tmx', 'map']:
+                files += self.get_map_dependencies(path)[0]
+
+        return sorted(set(files))
+
+
 class AssetManager(ContainerAware):
 
-    """Asset manager."""
+    """
+    Asset manager.
+
+    Loaded assets are cached and shared between callers, so they should be treated as immutable.
+    Callers which need to modify an asset should work on a copy.
+
+    """
 
     def __init__(self):
         """Constructor."""
@@ -23,6 +479,358 @@ class AssetManager(ContainerAware):
         self.configuration = self.container.get(Configuration)
         self.base_path = self.configuration.get('akurra.assets.base_path', 'assets')
 
+        # Assets are read from an archive if one is available, falling back to loose files
+        self.archive = None
+        archive_path = self.configuration.get('akurra.assets.archive', None)
+
+        if archive_path and os.path.isfile(archive_path):
+            self.archive = AssetArchive(archive_path)
+            logger.debug('Using asset archive "%s" [assets=%s]', archive_path, len(self.archive.index))
+
+        cache_directory = self.configuration.get('akurra.assets.cache_directory', '~/.cache/akurra')
+
+        # Converted images are stored on disk, so they don't need to be decoded and converted on every start
+        self.pixel_cache = None
+
+        if self.configuration.get('akurra.assets.pixel_cache.enabled', True):
+            self.pixel_cache = PixelCache(cache_directory)
+
+        # Maps are stored along with their derived data, so they don't need to be parsed and processed every start
+        self.map_cache = None
+
+        if self.configuration.get('akurra.assets.map_cache.enabled', True):
+            self.map_cache = CompiledMapCache(cache_directory)
+
+        self.atlas = None
+
+        if self.configuration.get('akurra.assets.atlas.enabled', False):
+            self.atlas = TextureAtlas(
+                page_size=self.configuration.get('akurra.assets.atlas.page_size', [1024, 1024]),
+                padding=self.configuration.get('akurra.assets.atlas.padding', 1)
+            )
+
+        self.cache = None
+
+        if self.configuration.get('akurra.assets.cache.enabled', True):
+            self.cache = AssetCache(memory_budget=self.configuration.get('akurra.assets.cache.memory_budget', 256))
+
+        # Decoding and finalizing functions, along with size estimators, per kind of asset
+        self.loaders = {
+            'image': [self.decode_image, self.finalize_image, get_surface_size],
+            'sound': [self.decode_sound, self.finalize_sound, get_sound_size],
+            'tmx': [self.decode_tmx_data, self.finalize_tmx_data, get_tmx_size],
+            'map': [self.decode_compiled_map, self.finalize_compiled_map, lambda x: get_tmx_size(x.tmx)],
+        }
+
+        # Preloads which haven't been finalized yet by key, and keys of preloads which are ready to be finalized
+        self.events = self.container.get(EventManager)
+        self.executor = ThreadPoolExecutor(max_workers=self.configuration.get('akurra.assets.preload.workers', 2))
+        self.finalize_budget = self.configuration.get('akurra.assets.preload.finalize_budget_millis', 4) / 1000
+        self.pending = {}
+        self.finalize_queue = queue.Queue()
+
+        # Bundle size and load time statistics by bundle name
+        self.manifest = AssetManifest(self)
+        self.bundle_stats = {}
+
+        # Hot reloading: files of loaded assets are checked for changes periodically, after which only the assets
+        # loaded from changed files are reloaded and the things depending on them are refreshed
+        self.hot_reload = self.configuration.get('akurra.assets.hot_reload.enabled', False)
+        self.hot_reload_interval = self.configuration.get('akurra.assets.hot_reload.interval', 1)
+        self.next_reload_check = 0
+        # Signatures of watched files by path, and keys of the assets loaded from them
+        self.watched_files = {}
+        self.file_keys = {}
+        # Loaded assets, packed atlas images derived from them and callbacks of dependents, by key
+        self.loaded_assets = weakref.WeakValueDictionary()
+        self.atlas_images = {}
+        self.dependents = {}
+
+    def start(self):
+        """Start the asset manager."""
+        self.events.register(TickEvent, self.on_tick)
+
+    def stop(self):
+        """Stop the asset manager."""
+        self.events.unregister(self.on_tick)
+        self.executor.shutdown(wait=False)
+
+    def get_key(self, kind, path, **options):
+        """Return the key to cache an asset by."""
+        return (kind, path) + tuple(sorted(options.items()))
+
+    def get_asset(self, kind, asset_path, **options):
+        """
+        Return an asset, loading and caching it if needed.
+
+        If the asset is being preloaded, the preload is completed first.
+
+        :param kind: Kind of asset to return, e.g. "image".
+        :param asset_path: Relative path of asset to process.
+        :param options: Loading options for the asset.
+
+        """
+        path = self.get_path(asset_path)
+        key = self.get_key(kind, path, **options)
+
+        if key in self.pending:
+            return self.finalize_preload(key)
+
+        asset = self.cache.get(key) if self.cache else None
+
+        if asset is None:
+            decode, finalize, size_estimator = self.loaders[kind]
+            asset = finalize(decode(path, **options), **options)
+            self.cache_asset(key, asset, size_estimator)
+            self.watch(key, asset)
+
+        return asset
+
+    def cache_asset(self, key, asset, size_estimator):
+        """Add an asset to the cache, if caching is enabled."""
+        if self.cache:
+            self.cache.add(key, asset, size_estimator(asset))
+
+    def preload(self, kind, asset_path, **options):
+        """
+        Start loading an asset in the background and return a future for it.
+
+        Decoding happens on a worker thread, while finalizing (e.g. converting surfaces) happens
+        on the main thread during ticks. An AssetLoadedEvent is dispatched once the asset is loaded.
+
+        :param kind: Kind of asset to preload, e.g. "image".
+        :param asset_path: Relative path of asset to process.
+        :param options: Loading options for the asset.
+
+        """
+        path = self.get_path(asset_path)
+        key = self.get_key(kind, path, **options)
+
+        if key in self.pending:
+            return self.pending[key][1]
+
+        future = Future()
+        asset = self.cache.get(key) if self.cache else None
+
+        if asset is not None:
+            future.set_result(asset)
+            return future
+
+        worker = self.executor.submit(self.loaders[kind][0], path, **options)
+        worker.add_done_callback(lambda x: self.finalize_queue.put(key))
+        self.pending[key] = [worker, future, kind, path, options]
+
+        return future
+
+    def preload_batch(self, assets):
+        """
+        Start loading a batch of assets in the background and return an AssetBatch for tracking them.
+
+        :param assets: List of [kind, asset path, options] entries, with options being optional.
+
+        """
+        return AssetBatch([self.preload(x[0], x[1], **(x[2] if len(x) > 2 else {})) for x in assets])
+
+    def finalize_preload(self, key):
+        """Finish a pending preload on the current thread, waiting for decoding if needed, and return the asset."""
+        worker, future, kind, path, options = self.pending.pop(key)
+        decode, finalize, size_estimator = self.loaders[kind]
+
+        try:
+            asset = finalize(worker.result(), **options)
+        except Exception as e:
+            future.set_exception(e)
+            self.events.dispatch(AssetLoadedEvent(kind, path, pending=len(self.pending), error=str(e)))
+            raise
+
+        self.cache_asset(key, asset, size_estimator)
+        self.watch(key, asset)
+        future.set_result(asset)
+        self.events.dispatch(AssetLoadedEvent(kind, path, pending=len(self.pending)))
+
+        return asset
+
+    def watch(self, key, asset):
+        """Start watching the files an asset was loaded from for changes, if hot reloading is enabled."""
+        if not self.hot_reload:
+            return
+
+        try:
+            self.loaded_assets[key] = asset
+        except TypeError:
+            # Not all assets (e.g. sounds) support weak references, these are simply replaced when reloaded
+            pass
+
+        for path in self.get_source_paths(key[0], key[1], asset):
+            if path not in self.watched_files:
+                self.watched_files[path] = self.get_file_signature(path)
+
+            self.file_keys.setdefault(path, set()).add(key)
+
+    def get_source_paths(self, kind, path, asset):
+        """Return the paths of the files an asset was loaded from."""
+        if kind == 'tmx':
+            return get_map_source_paths(asset)
+
+        if kind == 'map':
+            return get_map_source_paths(asset.tmx)
+
+        return [path]
+
+    def add_dependent(self, kind, asset_path, callback, **options):
+        """
+        Add a callback to call with the new version of an asset whenever it is reloaded.
+
+        Callbacks are referenced weakly, so they have to be bound methods and don't keep their objects alive.
+        Callbacks of objects which no longer exist are dropped whenever a callback is added, so the amount of
+        callbacks kept per asset doesn't grow as dependents come and go.
+
+        :param kind: Kind of asset to depend on, e.g. "image".
+        :param asset_path: Relative path of the asset.
+        :param callback: Bound method to call.
+        :param options: Loading options for the asset.
+
+        """
+        if self.hot_reload:
+            key = self.get_key(kind, self.get_path(asset_path), **options)
+            self.dependents[key] = [x for x in self.dependents.get(key, []) if x() is not None] + \
+                [weakref.WeakMethod(callback)]
+
+    def check_for_changes(self):
+        """Reload the assets loaded from files which changed since they were loaded."""
+        for path, signature in list(self.watched_files.items()):
+            try:
+                current_signature = self.get_file_signature(path)
+            except OSError:
+                # The file may be in the middle of being replaced, so it is checked again later
+                continue
+
+            if current_signature != signature:
+                logger.info('File changed, reloading assets [path=%s]', path)
+                self.watched_files[path] = current_signature
+                [self.reload_asset(x) for x in list(self.file_keys.get(path, []))]
+
+    def reload_asset(self, key):
+        """
+        Reload an asset and refresh the things depending on it.
+
+        Images are shared, so they are updated in place if their size and format didn't change, which
+        immediately refreshes every user of the image. Images packed into the atlas from them are refreshed as well.
+        Dependents are called with the new version of the asset afterwards.
+
+        :param key: Key of the asset to reload.
+
+        """
+        kind, path, options = key[0], key[1], dict(key[2:])
+        decode, finalize, size_estimator = self.loaders[kind]
+
+        try:
+            asset = finalize(decode(path, **options), **options)
+        except Exception:
+            logger.exception('Unable to reload asset [key=%s]', key)
+            return
+
+        previous = self.loaded_assets.get(key, None)
+
+        if kind == 'image' and previous and previous.get_size() == asset.get_size() and \
+                previous.get_pitch() == asset.get_pitch() and previous.get_masks() == asset.get_masks():
+            previous.get_buffer().write(asset.get_buffer().raw)
+            previous.set_colorkey(asset.get_colorkey())
+            asset = previous
+
+        self.cache_asset(key, asset, size_estimator)
+        self.watch(key, asset)
+
+        for packed, size in self.atlas_images.get(key, []):
+            self.repack_image(packed, pygame.transform.smoothscale(asset, size) if size else asset)
+
+        callbacks = [x() for x in self.dependents.get(key, [])]
+        self.dependents[key] = [weakref.WeakMethod(x) for x in callbacks if x]
+        [x(asset) for x in callbacks if x]
+
+        self.events.dispatch(AssetReloadedEvent(kind, path))
+
+    def on_tick(self, event):
+        """Finalize decoded preloads within a time budget, and reload changed assets if hot reloading is enabled."""
+        if self.hot_reload and time.perf_counter() >= self.next_reload_check:
+            self.next_reload_check = time.perf_counter() + self.hot_reload_interval
+            self.check_for_changes()
+
+        deadline = time.perf_counter() + self.finalize_budget
+
+        while time.perf_counter() < deadline:
+            try:
+                key = self.finalize_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            # The preload may have been completed by a synchronous load in the meantime
+            if key not in self.pending:
+                continue
+
+            try:
+                self.finalize_preload(key)
+            except Exception:
+                logger.exception('Unable to preload asset [key=%s]', key)
+
+    def load_bundle(self, name):
+        """
+        Load all assets of a bundle, returning them in manifest order.
+
+        :param name: Name of the bundle.
+
+        """
+        start = time.perf_counter()
+        assets = [self.get_asset(kind, path, **options) for kind, path, options in self.manifest.get_bundle(name)]
+        self.record_bundle_stats(name, assets, time.perf_counter() - start)
+
+        return assets
+
+    def preload_bundle(self, name):
+        """
+        Start loading all assets of a bundle in the background and return an AssetBatch for tracking them.
+
+        :param name: Name of the bundle.
+
+        """
+        start = time.perf_counter()
+        batch = self.preload_batch(self.manifest.get_bundle(name))
+
+        def on_done(future):
+            """Record bundle statistics once the last asset of the bundle is done."""
+            if batch.done() and name not in self.bundle_stats:
+                assets = [None if x.exception() else x.result() for x in batch.futures]
+                self.record_bundle_stats(name, assets, time.perf_counter() - start)
+
+        self.bundle_stats.pop(name, None)
+        [x.add_done_callback(on_done) for x in batch.futures]
+
+        return batch
+
+    def record_bundle_stats(self, name, assets, load_time):
+        """Record and log the size and load time of a bundle."""
+        entries = self.manifest.get_bundle(name)
+        sizes = [self.loaders[entry[0]][2](asset) for entry, asset in zip(entries, assets) if asset is not None]
+
+        self.bundle_stats[name] = {
+            'assets': len(entries),
+            'disk_size': sum([self.get_file_size(x) for x in self.manifest.get_bundle_files(name)]),
+            'memory_size': sum(sizes),
+            'load_time': load_time,
+        }
+
+        logger.info('Loaded bundle "%s" [assets=%s, disk=%.2fMB, memory=%.2fMB, time=%.2fms]', name,
+                    len(entries), self.bundle_stats[name]['disk_size'] / 1048576,
+                    self.bundle_stats[name]['memory_size'] / 1048576, load_time * 1000)
+
+    def get_bundle_stats(self):
+        """Return size (in bytes) and load time (in s) statistics for the bundles loaded so far."""
+        return self.bundle_stats
+
+    def get_cache_stats(self):
+        """Return asset cache statistics, or None if caching is disabled."""
+        return self.cache.get_stats() if self.cache else None
+
     def get_path(self, asset_path):
         """
         Return a path to an asset while taking distributions and base paths into account.
@@ -32,6 +840,64 @@ class AssetManager(ContainerAware):
         """
         return os.path.join(self.base_path, asset_path)
 
+    def get_archive_key(self, path):
+        """Return the key of a file in the asset archive, or None if it isn't archived."""
+        if not self.archive:
+            return None
+
+        key = self.get_asset_path(path)
+
+        return key if self.archive.has(key) else None
+
+    def get_file_size(self, path):
+        """Return the size of a file containing an asset, in bytes."""
+        key = self.get_archive_key(path)
+
+        return self.archive.get_size(key) if key else os.path.getsize(path)
+
+    def read_file(self, path):
+        """Return the contents of a file containing an asset."""
+        key = self.get_archive_key(path)
+
+        if key:
+            return self.archive.read(key)
+
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def get_file_signature(self, path):
+        """Return a signature of a file containing an asset, which changes along with its contents."""
+        key = self.get_archive_key(path)
+
+        # Archived files change whenever the archive is rebuilt
+        if key:
+            return [os.stat(self.archive.path).st_mtime_ns, self.archive.get_size(key)]
+
+        stat = os.stat(path)
+
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def load_image(self, path):
+        """Load an unconverted image from the asset archive or a loose file."""
+        key = self.get_archive_key(path)
+
+        return self.archive.load_image(key) if key else pygame.image.load(path)
+
+    def parse_xml(self, path):
+        """Parse an XML file from the asset archive or a loose file and return its root element."""
+        key = self.get_archive_key(path)
+
+        return ElementTree.fromstring(bytes(self.archive.read(key))) if key else ElementTree.parse(path).getroot()
+
+    def get_asset_path(self, path):
+        """
+        Return the relative path of an asset, being the inverse of get_path().
+
+        :param path: Path to the asset, including the base path.
+
+        """
+        return os.path.relpath(os.path.normpath(path), self.base_path).replace(os.sep, '/')
+
     def get_sound(self, asset_path):
         """
         Return an sfx object (OGG only for now).
@@ -39,10 +905,7 @@ class AssetManager(ContainerAware):
         :param asset_path: Relative path of asset to process.
 
         """
-        path = self.get_path(asset_path)
-        sound = pygame.mixer.Sound(path)
-
-        return sound
+        return self.get_asset('sound', asset_path)
 
     def get_image(self, asset_path, colorkey=None, alpha=False):
         """
@@ -51,15 +914,229 @@ class AssetManager(ContainerAware):
         :param asset_path: Relative path of asset to process.
 
         """
-        path = self.get_path(asset_path)
-        image = pygame.image.load(path)
-        image = image.convert_alpha() if alpha else image.convert()
+        return self.get_asset('image', asset_path, **get_image_options(colorkey, alpha))
+
+    def get_pixel_cache_key(self, path, mode):
+        """
+        Return the key to store an image converted in a mode under in the pixel cache, or None if it can't be cached.
+
+        :param path: Path to the image.
+        :param mode: Conversion mode, either "alpha", "opaque" or "auto" (based on the image).
+
+        """
+        display = pygame.display.get_surface()
+
+        if not self.pixel_cache or not display:
+            return None
+
+        return get_pixel_cache_key(self.read_file(path), mode, display.get_bitsize(), display.get_masks())
+
+    def decode_converted_image(self, path, mode):
+        """
+        Decode an image, or load it from the pixel cache if it was converted before.
+
+        Returns [image, whether or not the image is converted, pixel cache key to store the converted image under].
+
+        :param path: Path to the image.
+        :param mode: Conversion mode, either "alpha", "opaque" or "auto" (based on the image).
+
+        """
+        key = self.get_pixel_cache_key(path, mode)
+        image = self.pixel_cache.load(key) if key else None
+
+        if image:
+            return [image, True, None]
+
+        return [self.load_image(path), False, key]
+
+    def convert_image(self, decoded, mode):
+        """
+        Convert an image returned by decode_converted_image(), storing it in the pixel cache if needed.
+
+        :param decoded: Image as returned by decode_converted_image().
+        :param mode: Conversion mode, either "alpha", "opaque" or "auto" (based on the image).
+
+        """
+        image, converted, key = decoded
+
+        if not converted:
+            if mode == 'auto':
+                mode = 'alpha' if image.get_flags() & pygame.SRCALPHA else 'opaque'
+
+            image = image.convert_alpha() if mode == 'alpha' else image.convert()
+
+            if key:
+                self.pixel_cache.save(key, image)
+
+        return image
+
+    def decode_image(self, path, colorkey=None, alpha=False):
+        """Decode an image, without converting it."""
+        return self.decode_converted_image(path, 'alpha' if alpha else 'opaque')
+
+    def finalize_image(self, decoded, colorkey=None, alpha=False):
+        """Convert a decoded image to the display format."""
+        image = self.convert_image(decoded, 'alpha' if alpha else 'opaque')
 
         if colorkey:
             image.set_colorkey(colorkey)
 
         return image
 
+    def decode_sound(self, path):
+        """Decode a sound."""
+        key = self.get_archive_key(path)
+        sound = self.archive.load_sound(key) if key else None
+
+        # Pre-decoded samples can't be used if the mixer settings changed since the archive was built
+        return sound or pygame.mixer.Sound(path)
+
+    def finalize_sound(self, sound):
+        """Finalize a decoded sound."""
+        return sound
+
+    def decode_tileset_image(self, path, tilesets):
+        """Decode a tileset image, which is converted as a whole if it was cached before, and add it to a list."""
+        tilesets.append(self.decode_converted_image(path, 'auto'))
+
+        return tilesets[-1][0]
+
+    def decode_tmx_data(self, path):
+        """Decode TMX data, without converting its images."""
+        conversions = {}
+        tilesets = []
+        tmx_data = pytmx.TiledMap(image_loader=create_deferred_image_loader(
+            conversions, load=lambda x: self.decode_tileset_image(x, tilesets)))
+
+        # The map is parsed separately, so it can be read from the asset archive as well
+        node = self.parse_xml(path)
+        tmx_data.filename = path
+        tmx_data.parse_xml(node)
+        tmx_data.external_tilesets = get_external_tileset_paths(path, node)
+
+        return [tmx_data, conversions, tilesets]
+
+    def finalize_tmx_data(self, decoded):
+        """Convert the images of decoded TMX data to the display format."""
+        tmx_data, conversions, tilesets = decoded
+
+        # Tiles are converted separately, but tileset images are converted as a whole for the pixel cache
+        for tileset in tilesets:
+            if tileset[2]:
+                self.convert_image(tileset, 'auto')
+
+        for i, image in enumerate(tmx_data.images):
+            if image and id(image) in conversions:
+                tmx_data.images[i] = smart_convert(image, *conversions[id(image)][1:])
+
+        return tmx_data
+
+    def decode_compiled_map(self, path):
+        """Decode a compiled map, loading it from the compiled map cache if it is up to date."""
+        compiled_map = self.map_cache.load(path, self.get_file_signature) if self.map_cache else None
+
+        if not compiled_map:
+            tmx_data, conversions, tilesets = self.decode_tmx_data(path)
+            compact_tile_layers(tmx_data)
+            compiled_map = CompiledMap(tmx_data)
+
+            if self.map_cache:
+                self.map_cache.save(path, compiled_map, {x: self.get_file_signature(x)
+                                                         for x in get_map_source_paths(tmx_data)})
+
+            return [compiled_map, conversions, tilesets]
+
+        # Compiled maps are stored without images, so these are loaded the same way as when parsing the map
+        conversions = {}
+        tilesets = []
+        compiled_map.tmx.image_loader = create_deferred_image_loader(
+            conversions, load=lambda x: self.decode_tileset_image(x, tilesets))
+        compiled_map.tmx.reload_images()
+
+        return [compiled_map, conversions, tilesets]
+
+    def finalize_compiled_map(self, decoded):
+        """Convert the images of a decoded compiled map to the display format."""
+        compiled_map, conversions, tilesets = decoded
+        self.finalize_tmx_data([compiled_map.tmx, conversions, tilesets])
+
+        return compiled_map
+
+    def get_compiled_map(self, asset_path):
+        """
+        Return a compiled map (TMX data along with collision, mana and terrain data) by processing an asset.
+
+        :param asset_path: Relative path of asset to process.
+
+        """
+        return self.get_asset('map', asset_path)
+
+    def get_packed_image(self, key):
+        """
+        Return an image which was packed into the texture atlas, or None if it wasn't.
+
+        :param key: Key the image was packed by.
+
+        """
+        return self.atlas.get(key) if self.atlas else None
+
+    def pack_image(self, key, image, area=None):
+        """
+        Pack an image (or a region of one) into the texture atlas and return the packed image.
+
+        If the texture atlas is disabled, a separate copy of the image (or region) is returned.
+
+        :param key: Key to identify the packed image by.
+        :param image: Image to pack.
+        :param area: Region of the image to pack, defaults to the entire image.
+
+        """
+        if self.atlas:
+            return self.atlas.add(key, image, area)
+
+        area = pygame.Rect(area) if area else image.get_rect()
+        surface = pygame.Surface(area.size, flags=pygame.HWSURFACE | pygame.SRCALPHA)
+        surface.blit(image, [0, 0], area)
+
+        return surface
+
+    def repack_image(self, packed, image, area=None):
+        """
+        Replace the contents of a packed image, e.g. after the image it was packed from was reloaded.
+
+        :param packed: Packed image, as returned by pack_image().
+        :param image: Image to pack.
+        :param area: Region of the image to pack, defaults to the entire image.
+
+        """
+        packed.fill([0, 0, 0, 0])
+        packed.blit(image, [0, 0], area)
+
+    def get_atlas_image(self, asset_path, size=None):
+        """
+        Return an image packed into the texture atlas by processing an asset.
+
+        :param asset_path: Relative path of asset to process.
+        :param size: Size to scale the image to, if any.
+
+        """
+        key = (asset_path, tuple(size) if size else None)
+        image = self.get_packed_image(key)
+
+        if not image:
+            image = self.get_image(asset_path, alpha=True)
+
+            if size:
+                image = pygame.transform.smoothscale(image, size)
+
+            image = self.pack_image(key, image)
+
+            if self.hot_reload:
+                image_key = self.get_key('image', self.get_path(asset_path), **get_image_options(alpha=True))
+                self.atlas_images.setdefault(image_key, []).append([image, tuple(size) if size else None])
+
+        return image
+
     def get_tmx_data(self, asset_path):
         """
         Return TMX data by processing an asset.
@@ -67,10 +1144,7 @@ class AssetManager(ContainerAware):
         :param asset_path: Relative path of asset to process.
 
         """
-        path = self.get_path(asset_path)
-        tmx_data = pytmx.load_pygame(path)
-
-        return tmx_data
+        return self.get_asset('tmx', asset_path)
 
     def get_map_data(self, asset_path):
         """
@@ -9,6 +9,8 @@ from .display import DisplayModule, DisplayLayer
 from .entities import EntityManager
 from .events import TickEvent, EventManager
 from .modules import Module
+from .pacing import FramePacer
+from .assets import AssetManager
 from .session import SessionManager
 from .utils import map_point_to_screen
 
@@ -38,13 +40,20 @@ class DebugModule(Module):
         self.session = self.container.get(SessionManager)
 
         self.clock = self.container.get(DisplayClock)
+        self.pacer = self.container.get(FramePacer)
+        self.assets = self.container.get(AssetManager)
         self.font = pygame.font.SysFont('monospace', 14)
 
         self.layer = DisplayLayer(flags=pygame.SRCALPHA, z_index=250)
 
+        # Overlay pages, which can be cycled through
+        self.pages = [self.get_overview_text, self.get_system_stats_text]
+        self.page = 0
+
     def start(self):
         """Start the module."""
         self.input.add_action_listener('debug_toggle', self.debug_toggle)
+        self.input.add_action_listener('debug_page_toggle', self.debug_page_toggle)
 
         if self.debug.value:
             self.display.add_layer(self.layer)
@@ -52,6 +61,7 @@ class DebugModule(Module):
 
     def stop(self):
         """Stop the module."""
+        self.input.remove_action_listener(self.debug_page_toggle)
         self.input.remove_action_listener(self.debug_toggle)
 
     def debug_toggle(self, event):
@@ -66,10 +76,15 @@ class DebugModule(Module):
                 self.display.remove_layer(self.layer)
                 self.events.unregister(self.on_tick)
 
+    def debug_page_toggle(self, event):
+        """Switch to the next debug overlay page."""
+        if event.state:
+            self.page = (self.page + 1) % len(self.pages)
+
     def on_tick(self, event):
         """Handle a tick."""
         # First, clear the layer
-        self.layer.surface.fill([0, 0, 0, 0])
+        self.layer.clear()
 
         # Keep track of all layers and rects so we can render collision stuff later
         layers = []
@@ -83,7 +98,7 @@ class DebugModule(Module):
             entity_rects.append(rect)
 
             rect = [map_point_to_screen(layer.map_layer, [rect.x, rect.y]), [rect.width, rect.height]]
-            self.layer.surface.fill([128, 0, 128, 150], rect)
+            self.layer.fill([128, 0, 128, 150], rect)
 
             # Track the collision rectangles of this layer
             if layer not in layers:
@@ -97,10 +112,23 @@ class DebugModule(Module):
                     continue
 
                 rect = [map_point_to_screen(layer.map_layer, [rect.x, rect.y]), [rect.width, rect.height]]
-                self.layer.surface.fill([0, 128, 0, 150], rect)
+                self.layer.fill([0, 128, 0, 150], rect)
+
+        text = self.pages[self.page]()
 
-        self.layer.surface.fill([10, 10, 10, 200], [5, 5, 300, 190])
+        offset_x = 10
+        offset_y = 10
+        line_height = 15
 
+        width = max([self.font.size(t)[0] for t in text] + [290]) + 10
+        self.layer.fill([10, 10, 10, 200], [5, 5, width, len(text) * line_height + 10])
+
+        for t in text:
+            self.layer.blit(self.font.render(t, 1, (255, 255, 0)), [offset_x, offset_y])
+            offset_y += line_height
+
+    def get_overview_text(self):
+        """Return the lines of text for the overview page."""
         # info = pygame.display.Info()
 
         # text = [
@@ -118,11 +146,21 @@ class DebugModule(Module):
         #     "SW surface pixel alpha blit accel: %s" % info.blit_sw_A
         # ]
 
+        frame_stats = self.pacer.get_stats()
+
         text = [
             "Akurra DEV",
-            "FPS: %.2f" % self.clock.get_fps()
+            "FPS: %.2f" % self.clock.get_fps(),
+            "Frame p50/p95/p99: %.1f/%.1f/%.1f ms" % (frame_stats['p50'], frame_stats['p95'], frame_stats['p99']),
+            "Frame cost: %.1f ms" % frame_stats['cost']
         ]
 
+        asset_stats = self.assets.get_cache_stats()
+
+        if asset_stats:
+            text.append("Asset cache: %d hits, %d misses, %.1f mb" %
+                        (asset_stats['hits'], asset_stats['misses'], asset_stats['bytes'] / (1024 * 1024)))
+
         player = self.session.get('player')
 
         if player:
@@ -142,10 +180,25 @@ class DebugModule(Module):
                                       math.floor(y)) for x, y in player.components['mana'].mana.items()])
             ]
 
-        offset_x = 10
-        offset_y = 10
-        line_height = 15
+        return text
 
-        for t in text:
-            self.layer.surface.blit(self.font.render(t, 1, (255, 255, 0)), [offset_x, offset_y])
-            offset_y += line_height
+    def get_system_stats_text(self):
+        """Return the lines of text for the system statistics page."""
+        text = [
+            "Akurra DEV - Systems",
+            "FPS: %.2f" % self.clock.get_fps(),
+            ""
+        ]
+
+        if not self.entities.profiler.enabled:
+            return text + ["System profiling is disabled."]
+
+        stats = self.entities.get_system_stats()
+        text.append("%-28s %6s %6s %7s %7s" % ("System", "Ent.", "Upd.", "Avg ms", "Max ms"))
+
+        for name, system_stats in sorted(stats.items(), key=lambda x: x[1]['average_time'], reverse=True):
+            text.append("%-28s %6d %6d %7.3f %7.3f" % (name[:28], system_stats['average_entities'],
+                                                       system_stats['average_updates'],
+                                                       system_stats['average_time'], system_stats['max_time']))
+
+        return text
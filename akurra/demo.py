@@ -24,9 +24,14 @@ class DemoGame(Game):
     def __init__(self):
         """Constructor."""
         self.states = self.container.get(StateManager)
+        self.assets = self.container.get(AssetManager)
+
+        # Load the demo's assets in the background while the splash screen is shown
+        self.preload = self.assets.preload_bundle('demo')
 
         self.game_realm = DemoGameState()
-        self.splash_screen = SplashScreen(image='graphics/logos/multatronic.png', next=self.game_realm)
+        self.splash_screen = SplashScreen(image='graphics/logos/multatronic.png', next=self.game_realm,
+                                          preload=self.preload)
         self.states.add(self.splash_screen)
         self.states.add(self.game_realm)
 
@@ -61,10 +66,10 @@ class DemoGameState(GameState):
         self.input.add_action_listener('game_quit', self.on_quit)
 
         # self.tmx_data = self.assets.get_tmx_data('pyscroll_demo/grasslands.tmx')
-        self.tmx_data = self.assets.get_tmx_data('maps/urdarbrunn/map.tmx')
-        self.layer = ScrollingMapEntityDisplayLayer(self.tmx_data, default_layer=2)
+        self.compiled_map = self.assets.get_compiled_map('maps/urdarbrunn/map.tmx')
+        self.layer = ScrollingMapEntityDisplayLayer(self.compiled_map, default_layer=2)
 
-        self.ui_layer = DisplayLayer(flags=pygame.SRCALPHA, z_index=101)
+        self.ui_layer = DisplayLayer(flags=pygame.SRCALPHA, z_index=101, static=True)
 
         self.display.add_layer(self.ui_layer)
         self.display.add_layer(self.layer)
@@ -1,4 +1,5 @@
 """Screen module."""
+import copy
 import logging
 import pygame
 import random
@@ -11,7 +12,9 @@ from .input import InputModule
 from .events import Event, TickEvent, EventManager
 from .entities import LayerComponent, EntityManager, MapLayerComponent
 from .modules import Module
-from .utils import ContainerAware
+from .assets import AssetManager
+from .maps import get_map_cache_key, ChunkedMapRenderer, CompiledMap, MapChunkCache
+from .utils import ContainerAware, merge_rects
 
 
 logger = logging.getLogger(__name__)
@@ -24,25 +27,54 @@ class FrameRenderCompletedEvent(Event):
 
 class DisplayLayer(ContainerAware):
 
-    """Display layer."""
+    """
+    Display layer.
 
-    def __init__(self, size=None, flags=0, position=[0, 0], z_index=None):
-        """Constructor."""
+    Only the regions of a layer which were drawn on since it was last cleared are blitted
+    onto the display, and empty layers are skipped entirely. Layers which only need a small part
+    of the display can declare their bounding box through their size and position.
+
+    Static layers are layers whose contents rarely change. Consecutive static layers are flattened
+    into a single cached surface by the display, which is only rebuilt when one of them is dirty.
+
+    """
+
+    # Whether or not the layer draws onto its own surface before being drawn onto the display
+    buffered = True
+
+    def __init__(self, size=None, flags=0, position=[0, 0], z_index=None, static=False):
+        """
+        Constructor.
+
+        :param size: Size of the layer, in pixels. Defaults to the size of the display.
+        :param flags: Surface flags for the layer.
+        :param position: Position of the layer's top left corner on the display.
+        :param z_index: Z-index of the layer.
+        :param static: Whether or not the layer's contents rarely change.
+
+        """
         if not z_index:
             z_index = 100
 
+        # Layers default to the size of the internal render target, or that of the display
         if not size:
-            info = pygame.display.Info()
-            size = info.current_w, info.current_h
+            size = self.container.get(DisplayModule).get_render_size()
 
         self._z_index = z_index
+        self._static = static
         self.display = None
 
         self.size = size
         self.position = position
         self.flags = flags
 
-        self.surface = pygame.Surface(self.size, flags=self.flags)
+        self.surface = pygame.Surface(self.size, flags=self.flags) if self.buffered else None
+
+        # Regions of the layer which changed since the last frame, with None meaning the entire layer
+        self.dirty_rects = [None]
+        # Regions of the layer which were drawn on since it was last cleared, with None meaning the entire layer
+        # A new transparent layer has no content, while a new opaque one has
+        self.drawn_rects = [] if self.flags & pygame.SRCALPHA else [None]
 
     @property
     def z_index(self):
@@ -64,6 +96,25 @@ class DisplayLayer(ContainerAware):
         if display:
             display.add(self)
 
+    @property
+    def static(self):
+        """Return whether or not the layer's contents rarely change."""
+        return self._static
+
+    @static.setter
+    def static(self, value):
+        """Set whether or not the layer's contents rarely change."""
+        self._static = value
+
+        # Make sure the display recomposes its layers
+        if self.display:
+            self.display.composition = None
+
+    @property
+    def dirty(self):
+        """Return whether or not the layer changed since the last frame."""
+        return bool(self.dirty_rects)
+
     def update(self, delta_time):
         """
         Compute an update to the layer's state.
@@ -77,7 +128,84 @@ class DisplayLayer(ContainerAware):
 
     def draw(self, surface):
         """Draw the layer onto a surface."""
-        surface.blit(self.surface, self.position)
+        for rect in self.get_content_rects():
+            surface.blit(self.surface, rect.move(self.position), rect)
+
+    def get_content_rects(self):
+        """Return the regions of the layer which were drawn on since it was last cleared."""
+        if None in self.drawn_rects:
+            return [self.surface.get_rect()]
+
+        return merge_rects(self.drawn_rects)
+
+    def add_drawn_rect(self, rect):
+        """
+        Register a region of the layer as having been drawn on.
+
+        :param rect: Region in layer projection, or None if the entire layer was drawn on.
+
+        """
+        if None in self.drawn_rects:
+            return
+
+        self.drawn_rects.append(rect)
+
+        # Keep the amount of regions down for layers which are drawn on without being cleared
+        if len(self.drawn_rects) > 32:
+            self.drawn_rects = merge_rects(self.drawn_rects)
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        """Blit a surface onto the layer, marking the affected region as changed."""
+        rect = self.surface.blit(source, dest, area, special_flags)
+        self.add_drawn_rect(rect)
+        self.mark_dirty(rect)
+
+    def fill(self, color, rect=None):
+        """Fill (part of) the layer with a color, marking the affected region as changed."""
+        rect = self.surface.fill(color, rect)
+        self.add_drawn_rect(rect)
+        self.mark_dirty(rect)
+
+    def clear(self):
+        """
+        Clear the contents of the layer.
+
+        Only the regions which were drawn on since the last clear are cleared and marked as changed.
+
+        """
+        if None in self.drawn_rects:
+            self.surface.fill([0, 0, 0, 0])
+            self.mark_dirty()
+        else:
+            for rect in self.drawn_rects:
+                self.mark_dirty(self.surface.fill([0, 0, 0, 0], rect))
+
+        self.drawn_rects = []
+
+    def mark_dirty(self, rect=None):
+        """
+        Mark a region of the layer as changed.
+
+        :param rect: Changed region in layer projection, or None if the entire layer changed.
+
+        """
+        self.dirty_rects.append(pygame.Rect(rect) if rect is not None else None)
+
+    def get_dirty_rects(self):
+        """
+        Return the regions of the display this layer changed since the last frame.
+
+        Regions are returned in screen projection. None is returned if the entire display should be updated.
+
+        """
+        if None in self.dirty_rects:
+            return [pygame.Rect(self.position, self.size)]
+
+        return [x.move(self.position) for x in self.dirty_rects if x]
+
+    def reset_dirty_rects(self):
+        """Forget about all changed regions, usually after a frame has been rendered."""
+        self.dirty_rects = []
 
     def resize(self, size):
         """
@@ -87,7 +215,64 @@ class DisplayLayer(ContainerAware):
 
         """
         self.size = size
-        self.surface = pygame.transform.scale(self.surface, self.size)
+
+        if self.surface:
+            self.surface = pygame.transform.scale(self.surface, self.size)
+            self.add_drawn_rect(None)
+
+        self.mark_dirty()
+
+
+class StaticLayerComposition:
+
+    """
+    Static layer composition.
+
+    A run of consecutive static layers, flattened into a single pre-blended surface
+    which is only rebuilt when one of the layers is dirty.
+
+    """
+
+    def __init__(self, layers, size):
+        """
+        Constructor.
+
+        :param layers: Layers to compose, in the order they should be drawn.
+        :param size: Size of the composition, in pixels.
+
+        """
+        self.layers = layers
+        self.size = size
+
+        self.surface = None
+        self.content_rects = []
+
+    def update(self, delta_time):
+        """Compute an update to the state of all composed layers."""
+        for layer in self.layers:
+            layer.update(delta_time)
+
+    def draw(self, surface):
+        """Draw the composition onto a surface, rebuilding it if needed."""
+        if not self.surface or any([layer.dirty for layer in self.layers]):
+            self.rebuild()
+
+        for rect in self.content_rects:
+            surface.blit(self.surface, rect, rect)
+
+    def rebuild(self):
+        """Rebuild the composition from its layers."""
+        if not self.surface:
+            self.surface = pygame.Surface(self.size, flags=pygame.SRCALPHA)
+
+        for rect in self.content_rects:
+            self.surface.fill([0, 0, 0, 0], rect)
+
+        self.content_rects = merge_rects([rect.move(layer.position) for layer in self.layers
+                                          for rect in layer.get_content_rects()], self.surface.get_rect())
+
+        for layer in self.layers:
+            layer.draw(self.surface)
 
 
 class EntityDisplayLayer(DisplayLayer):
@@ -95,14 +280,18 @@ class EntityDisplayLayer(DisplayLayer):
     """
     Entity display layer.
 
-    A layer for rendering and displaying entities.
+    A layer for rendering and displaying entities. Entities are drawn directly onto the
+    display, without an intermediate layer surface.
 
     """
 
+    buffered = False
+
     def __init__(self, **kwargs):
         """Constructor."""
         super().__init__(**kwargs)
         self.entities = {}
+        self.entity_rects = []
 
     def add_entity(self, entity):
         """Add an entity to the layer."""
@@ -116,13 +305,24 @@ class EntityDisplayLayer(DisplayLayer):
 
     def draw(self, surface):
         """Draw the layer onto a surface."""
-        self.surface.fill([0, 0, 0, 0])
+        offset_x, offset_y = self.position
+        viewport = surface.get_clip()
+        blit_sequence = []
 
-        for entity_id in self.entities:
-            self.surface.blit(self.entities[entity_id].components['sprite'].image,
-                              self.entities[entity_id].components['position'].primary_position)
+        # Collect blits for entities which are in view, and perform them all at once
+        for entity in self.entities.values():
+            image = entity.components['sprite'].image
+            position = entity.components['position'].primary_position
+            rect = image.get_rect(topleft=[position[0] + offset_x, position[1] + offset_y])
 
-        super().draw(surface)
+            if viewport.colliderect(rect):
+                blit_sequence.append((image, rect))
+
+        entity_rects = [x.move(-offset_x, -offset_y) for x in surface.blits(blit_sequence)]
+
+        # Both the regions entities were drawn at last frame and the ones they were drawn at now changed
+        self.dirty_rects += self.entity_rects + entity_rects
+        self.entity_rects = entity_rects
 
 
 class ScrollingMapEntityDisplayLayer(EntityDisplayLayer):
@@ -134,73 +334,197 @@ class ScrollingMapEntityDisplayLayer(EntityDisplayLayer):
 
     """
 
-    def __init__(self, tmx_data, default_layer=0, **kwargs):
-        """Constructor."""
+    def __init__(self, tmx_data, default_layer=0, chunk_size=16, culling_margin=128, **kwargs):
+        """
+        Constructor.
+
+        :param tmx_data: TMX data or a compiled map (which has collision, mana and terrain data precomputed)
+                         of the map to display.
+        :param default_layer: Map layer to render entities on.
+        :param chunk_size: Size of the chunks entities are partitioned into, in tiles.
+        :param culling_margin: Distance outside of the viewport within which entities are still considered
+                               visible, in pixels.
+
+        """
         super().__init__(**kwargs)
 
         self.em = self.container.get(EntityManager)
         self.events = self.container.get(EventManager)
+        self.assets = self.container.get(AssetManager)
+
+        self.compiled_map = tmx_data if isinstance(tmx_data, CompiledMap) else CompiledMap(tmx_data)
+        self.default_layer = default_layer
 
         # Create data source
-        self.map_data = pyscroll.data.TiledMapData(tmx_data)
-        self.map_layer = pyscroll.BufferedRenderer(self.map_data, self.size, clamp_camera=True)
+        self.map_data = pyscroll.data.TiledMapData(self.compiled_map.tmx)
+        self.map_layer = self.create_map_renderer(default_layer)
 
         self.surface = self.map_layer.buffer
         self.group = PyscrollGroup(map_layer=self.map_layer, default_layer=default_layer)
 
+        # Refresh the map in place when it is reloaded
+        self.assets.add_dependent('map' if isinstance(tmx_data, CompiledMap) else 'tmx',
+                                  self.assets.get_asset_path(self.map_data.tmx.filename), self.reload_map)
+
+        self.center = None
+        self.chunk_size = chunk_size
+
+        # Entities within this margin around the viewport are considered to be visible
+        self.culling_margin = culling_margin
+
+        self.camera = None
+        self.sprite_rects = []
+        self.drawn_sprite_rects = []
+
         self.build_collision_map()
         self.build_mana_map()
+        self.build_terrain_map()
         self.spawn_entities()
 
-        self.center = None
+    def create_map_renderer(self, default_layer):
+        """Create and return a map renderer, based on configuration."""
+        configuration = self.container.get(Configuration)
+
+        # The chunked renderer only renders chunks of the map near the camera, which is better suited for large maps
+        if configuration.get('akurra.display.map_renderer', 'buffered') == 'chunked':
+            chunk_size = configuration.get('akurra.display.chunked_map_renderer.chunk_size', 16)
+            cache = None
+
+            # Static chunks can be pre-rendered to disk, so they only need to be rendered once per map version
+            if configuration.get('akurra.display.chunked_map_renderer.bake', False):
+                cache = MapChunkCache(configuration.get('akurra.assets.cache_directory', '~/.cache/akurra'),
+                                      get_map_cache_key(self.map_data.tmx, chunk_size, default_layer))
+
+            return ChunkedMapRenderer(
+                self.map_data.tmx, self.size,
+                chunk_size=chunk_size,
+                sprite_layer=default_layer,
+                memory_budget=configuration.get('akurra.display.chunked_map_renderer.memory_budget', 64),
+                prefetch=configuration.get('akurra.display.chunked_map_renderer.prefetch', 1),
+                cache=cache
+            )
+
+        return pyscroll.BufferedRenderer(self.map_data, self.size, clamp_camera=True)
+
+    def reload_map(self, tmx_data):
+        """
+        Replace the map with a new version of it, keeping the entities on the layer.
+
+        Entities are not spawned again and all derived data (e.g. mana stores) is reset.
+
+        :param tmx_data: TMX data or a compiled map of the new version of the map.
+
+        """
+        logger.info('Reloading map [map=%s]', self.map_data.tmx.filename)
+
+        # Entity collision cores are appended after the map's collision rects
+        entity_collision_map = self.collision_map[len(self.compiled_map.collision_rects):]
+
+        self.compiled_map = tmx_data if isinstance(tmx_data, CompiledMap) else CompiledMap(tmx_data)
+        self.map_data = pyscroll.data.TiledMapData(self.compiled_map.tmx)
+        self.map_layer = self.create_map_renderer(self.default_layer)
+
+        self.surface = self.map_layer.buffer
+        sprites = self.group.sprites()
+        self.group = PyscrollGroup(map_layer=self.map_layer, default_layer=self.default_layer)
+        self.group.add(*sprites)
+
+        self.build_collision_map()
+        self.collision_map += entity_collision_map
+        self.build_mana_map()
+        self.build_terrain_map()
+
+        self.camera = None
+        self.mark_dirty()
 
     def build_collision_map(self):
         """Build a collision map based on map data."""
         logger.debug('Building collision map [map=%s]', self.map_data.tmx.filename)
-        self.collision_map = []
-
-        for o in self.map_data.tmx.objects:
-            if o.properties.get('collision', 'false') == 'true':
-                self.collision_map.append(pygame.Rect(o.x, o.y, o.width, o.height))
+        self.collision_map = [pygame.Rect(x) for x in self.compiled_map.collision_rects]
 
     def build_mana_map(self):
         """Build a mana map based on map data."""
         logger.debug('Building mana map [map=%s]', self.map_data.tmx.filename)
-        self.mana_map = {}
+
+        # Mana stores are depleted and replenished, so the layer works on a copy of the shared stores
+        self.mana_map = copy.deepcopy(self.compiled_map.mana_map)
         self.mana_replenishment_map = {}
 
-        # Loop through all vibible layers
-        for i, l in enumerate(self.map_data.tmx.visible_layers):
-            # Only continue for terrain layers
-            if l.properties.get('terrain', 'false') == 'true':
-                # Iterate over all tiles
-                for x in range(0, l.width):
-                    for y in range(0, l.height):
-                        tile = self.map_data.tmx.get_tile_properties(x, y, i)
-
-                        # Only continue if the current tile has mana types
-                        if tile and tile.get('mana_types'):
-                            # Initialize dicts if needed
-                            if not self.mana_map.get(i):
-                                self.mana_map[i] = {}
-
-                            if not self.mana_map[i].get(x):
-                                self.mana_map[i][x] = {}
-
-                            if not self.mana_map[i][x].get(y):
-                                self.mana_map[i][x][y] = {}
-
-                            # Parse mana type data
-                            mana_types = tile['mana_types'].split(';')
-                            mana_types = [x.split(':') for x in mana_types]
-
-                            # Index mana types by type, and use defaults
-                            for mana in mana_types:
-                                # .. = [<current_stores>, <max_stores>]
-                                self.mana_map[i][x][y][mana[0]] = [
-                                    float(mana[1]) if len(mana) > 1 else 1,
-                                    float(mana[2]) if len(mana) > 2 else (float(mana[1] if len(mana) > 1 else 1))
-                                ]
+    def build_terrain_map(self):
+        """Build a terrain map based on map data."""
+        logger.debug('Building terrain map [map=%s]', self.map_data.tmx.filename)
+        self.terrain_map = copy.deepcopy(self.compiled_map.terrain_map)
+
+    def get_terrain_type(self, map_position):
+        """
+        Return the terrain type at a position, or None if there is no terrain there.
+
+        :param map_position: Position to look up, in map projection.
+
+        """
+        return self.terrain_map.get_type(int(map_position[0]), int(map_position[1]))
+
+    def get_chunk(self, point):
+        """
+        Return the coordinates of the chunk containing a point.
+
+        :param point: Point to find the chunk for, in layer projection.
+
+        """
+        return (int(point[0] // (self.map_data.tmx.tilewidth * self.chunk_size)),
+                int(point[1] // (self.map_data.tmx.tileheight * self.chunk_size)))
+
+    def get_focus_chunk(self):
+        """Return the coordinates of the chunk the layer is centered on, or None if it isn't centered."""
+        if not self.center:
+            return None
+
+        return self.get_chunk(self.center.components['position'].layer_position)
+
+    def update_entity_chunk(self, entity):
+        """Assign an entity to the chunk containing its position."""
+        self.em.set_entity_chunk(entity, self, self.get_chunk(entity.components['position'].layer_position))
+
+    def get_viewport(self, size):
+        """
+        Center the camera if needed and return the region of the map in view, in layer projection.
+
+        :param size: Size of the surface the layer is drawn onto.
+
+        """
+        if self.center:
+            self.group.center(self.center.rect.center)
+
+        offset_x, offset_y = self.map_layer.get_center_offset()
+
+        return pygame.Rect([-offset_x, -offset_y], size)
+
+    def find_visible_entity_ids(self):
+        """Return the ids of the entities which are visible at the current camera position."""
+        return set([x.id for x in self.find_visible_entities(self.get_viewport(self.size))])
+
+    def find_visible_entities(self, viewport):
+        """
+        Find entities which are within a viewport, using the chunks entities are partitioned into.
+
+        :param viewport: Region to find entities in, in layer projection.
+
+        """
+        chunks = self.em.chunks.get(self, {})
+        area = viewport.inflate(self.culling_margin * 2, self.culling_margin * 2)
+        min_chunk = self.get_chunk(area.topleft)
+        max_chunk = self.get_chunk(area.bottomright)
+
+        entities = []
+
+        for x in range(min_chunk[0], max_chunk[0] + 1):
+            for y in range(min_chunk[1], max_chunk[1] + 1):
+                chunk = chunks.get((x, y), None)
+
+                if chunk:
+                    entities += chunk.values()
+
+        return entities
 
     def spawn_entities(self):
         """Spawn entities on the map based on map data."""
@@ -235,6 +559,9 @@ class ScrollingMapEntityDisplayLayer(EntityDisplayLayer):
         entity.add_component(MapLayerComponent())
         self.group.add(entity)
 
+        if 'position' in entity.components:
+            self.update_entity_chunk(entity)
+
         # If this entity supports collision detection, add its collision core to our collision map
         if 'physics' in entity.components:
             self.collision_map.append(entity.components['physics'].collision_core)
@@ -244,6 +571,7 @@ class ScrollingMapEntityDisplayLayer(EntityDisplayLayer):
         super().remove_entity(entity)
         entity.remove_component(MapLayerComponent)
         self.group.remove(entity)
+        self.em.unset_entity_chunk(entity)
 
         # If this entity supports collision detection, remove its collision core from our collision map
         if 'physics' in entity.components:
@@ -251,19 +579,45 @@ class ScrollingMapEntityDisplayLayer(EntityDisplayLayer):
 
     def draw(self, surface):
         """Draw the layer onto a surface."""
-        # Center the map/screen if needed
-        if self.center:
-            self.group.center(self.center.rect.center)
+        # Collect sprites which are in view and draw them along with the map
+        viewport = self.get_viewport(surface.get_size())
+        offset_x, offset_y = -viewport.x, -viewport.y
+        get_layer = self.group.get_layer_of_sprite
+
+        visible = self.find_visible_entities(viewport)
+        visible.sort(key=lambda x: x.components['position'].layer_position[1])
+
+        sprites = [(x.image, x.rect.move(offset_x, offset_y), get_layer(x))
+                   for x in visible if viewport.colliderect(x.rect)]
+        self.drawn_sprite_rects = [x[1] for x in sprites]
+
+        self.map_layer.draw(surface, surface.get_rect(), sprites)
+
+    def get_dirty_rects(self):
+        """Return the regions of the display this layer changed since the last frame."""
+        camera = (self.map_layer.view.left, self.map_layer.view.top, self.map_layer.xoffset, self.map_layer.yoffset)
+
+        # If the map scrolled, everything changed
+        if camera != self.camera or None in self.dirty_rects:
+            self.camera = camera
+            self.sprite_rects = []
 
-        # Draw the map and all sprites
-        self.group.draw(surface)
+            return None
+
+        sprite_rects = self.drawn_sprite_rects
+
+        # Both the regions sprites were drawn at last frame and the ones they were drawn at now changed
+        dirty_rects = self.sprite_rects + sprite_rects
+        self.sprite_rects = sprite_rects
+
+        return dirty_rects
 
     def resize(self, size):
         """Handle a resize."""
+        self.size = size
         self.map_layer.set_size(size)
         self.surface = self.map_layer.buffer
-
-        super().resize(size)
+        self.mark_dirty()
 
 
 class DisplayModule(Module):
@@ -280,15 +634,32 @@ class DisplayModule(Module):
         self.events = self.container.get(EventManager)
         self.input = self.container.get(InputModule)
 
+        # When running headless, drawing can be skipped entirely while layers are still updated
+        self.headless = self.container.get(HeadlessFlag).value
+        self.draw = not self.headless or self.configuration.get('akurra.headless.draw', False)
+
         self.resolution = self.configuration.get('akurra.display.resolution', [0, 0])
         self.caption = self.configuration.get('akurra.display.caption', 'Akurra DEV')
 
         self.flags = self.configuration.get('akurra.display.flags', ['DOUBLEBUF', 'HWSURFACE', 'RESIZABLE'])
         self.flags = functools.reduce(lambda x, y: x | y, [getattr(pygame, x) for x in self.flags])
 
+        # In dirty rect mode, only the regions of the display changed by layers are updated
+        self.dirty_rects = self.configuration.get('akurra.display.dirty_rects', False)
+        self.full_update = True
+
+        # With a render resolution, all layers draw onto an internal render target of a fixed size,
+        # which is scaled to fit the display once per frame
+        self.render_resolution = self.configuration.get('akurra.display.render_resolution', None)
+        self.scale_filter = self.configuration.get('akurra.display.scale_filter', 'nearest')
+        self.render_target = None
+        self.viewport = None
+
         self.screen = self.create_screen()
 
         self.layers = {}
+        # Layers and static layer compositions to draw, in order, built when needed
+        self.composition = None
         self.layer_z_indexes = []
 
     def start(self):
@@ -312,6 +683,8 @@ class DisplayModule(Module):
             self.layer_z_indexes = sorted(self.layers.keys(), key=int)
 
         self.layers[layer.z_index][layer] = 1
+        self.full_update = True
+        self.composition = None
 
         # Set display within layer
         layer.display = self
@@ -320,6 +693,8 @@ class DisplayModule(Module):
 
     def remove_layer(self, layer):
         """Remove a layer from the display."""
+        self.full_update = True
+        self.composition = None
         to_remove = None
 
         # If we're able to remove a layer and there are no other layers for this z_index,
@@ -343,23 +718,115 @@ class DisplayModule(Module):
         Internally, this will render all layers and perform a screen update.
         See also http://www.pygame.org/docs/ref/display.html#pygame.display.flip
 
+        In dirty rect mode, only the regions changed by layers are updated, with a full update
+        as a fallback when a layer changed entirely (e.g. when the map scrolls).
+
         :param event: TickEvent
 
         """
+        if not self.draw:
+            for item in self.get_composition():
+                item.update(event.delta_time)
+
+            for z_index in self.layer_z_indexes:
+                for layer in self.layers[z_index]:
+                    layer.reset_dirty_rects()
+
+            self.events.dispatch(FrameRenderCompletedEvent())
+            return
+
+        dirty_rects = [] if self.dirty_rects and not self.full_update else None
+        canvas = self.render_target or self.screen
+
+        for item in self.get_composition():
+            item.update(event.delta_time)
+            item.draw(canvas)
+
         for z_index in self.layer_z_indexes:
             for layer in self.layers[z_index]:
-                layer.update(event.delta_time)
-                layer.draw(self.screen)
+                if dirty_rects is not None:
+                    layer_dirty_rects = layer.get_dirty_rects()
+                    dirty_rects = dirty_rects + layer_dirty_rects if layer_dirty_rects is not None else None
+
+                layer.reset_dirty_rects()
+
+        if self.render_target:
+            self.scale_render_target(self.screen)
+            dirty_rects = None
+
+        if dirty_rects is None:
+            pygame.display.flip()
+            self.full_update = False
+        elif dirty_rects:
+            pygame.display.update(merge_rects(dirty_rects, self.screen.get_rect()))
 
-        pygame.display.flip()
         self.events.dispatch(FrameRenderCompletedEvent())
 
+    def scale_render_target(self, surface):
+        """Scale the internal render target onto (the viewport of) a surface."""
+        destination = surface.subsurface(self.viewport)
+
+        if self.scale_filter == 'smooth':
+            pygame.transform.smoothscale(self.render_target, self.viewport.size, destination)
+        else:
+            pygame.transform.scale(self.render_target, self.viewport.size, destination)
+
+    def get_render_size(self):
+        """Return the size layers are rendered at."""
+        return (self.render_target or self.screen).get_size()
+
+    def map_window_point(self, point):
+        """Convert a pair of coordinates from window projection to render projection."""
+        if not self.render_target:
+            return point
+
+        render_width, render_height = self.render_target.get_size()
+
+        return [(point[0] - self.viewport.x) * render_width / self.viewport.width,
+                (point[1] - self.viewport.y) * render_height / self.viewport.height]
+
+    def get_composition(self):
+        """
+        Return the layers to draw, in order.
+
+        Runs of consecutive static layers are replaced by a single static layer composition.
+
+        """
+        if self.composition is None:
+            self.composition = []
+            static_layers = []
+
+            for z_index in self.layer_z_indexes:
+                for layer in self.layers[z_index]:
+                    if layer.static and layer.buffered:
+                        static_layers.append(layer)
+                        continue
+
+                    self.composition += self.compose(static_layers)
+                    self.composition.append(layer)
+                    static_layers = []
+
+            self.composition += self.compose(static_layers)
+
+        return self.composition
+
+    def compose(self, layers):
+        """Return a list containing a composition for a run of static layers, if composing them is worthwhile."""
+        if len(layers) < 2:
+            return layers
+
+        return [StaticLayerComposition(layers, self.get_render_size())]
+
     def on_video_resize(self, event):
         """Handle resizing of the display."""
         old_size = self.screen.get_size()
         self.resolution = event.size
         self.screen = self.create_screen()
 
+        # Layers keep their size when rendering at a fixed resolution
+        if self.render_target:
+            return
+
         for z_index in self.layers:
             for layer in self.layers[z_index]:
                 if layer.size == old_size:
@@ -369,6 +836,17 @@ class DisplayModule(Module):
         """Create and return a screen with a few options."""
         screen = pygame.display.set_mode(self.resolution, self.flags)
         pygame.display.set_caption(self.caption)
+
+        if self.render_resolution:
+            if not self.render_target:
+                self.render_target = pygame.Surface(self.render_resolution).convert()
+
+            # Fit the render target onto the display, keeping its aspect ratio
+            self.viewport = self.render_target.get_rect().fit(screen.get_rect())
+            screen.fill([0, 0, 0])
+
+        self.full_update = True
+        self.composition = None
         logger.debug('Display created [resolution=%s, flags=%s]', self.resolution, self.flags)
 
         return screen
@@ -1,7 +1,16 @@
 """Entities module."""
+import os
 import logging
 import pygame
 import pyganim
+import weakref
+import json
+import csv
+import time
+import bisect
+import functools
+from array import array
+from collections import deque
 from uuid import uuid4
 from enum import Enum
 
@@ -11,7 +20,7 @@ from .audio import AudioModule
 from .modules import ModuleLoader
 from .utils import ContainerAware, map_point_to_screen, screen_point_to_layer, snake_case, memoize, \
     distance_vector_between
-from .assets import AssetManager
+from .assets import AssetManager, get_image_options
 
 logger = logging.getLogger(__name__)
 
@@ -191,6 +200,199 @@ class Entity(pygame.sprite.Sprite):
         self.entities.remove_entity_component(self, component)
 
 
+class SystemProfiler:
+
+    """
+    System profiler.
+
+    Instruments systems in order to record, per system per frame, the number of matched entities,
+    the number of updates, the number of handler calls and the time spent in handlers.
+    Time spent in a profiled handler which is called from within another one (e.g. when an event
+    is handled directly) is only counted once, for the innermost handler, so the times of all
+    systems add up to the total time spent in systems.
+
+    Statistics are kept for a rolling window of frames and summarized as histograms of the time per frame.
+
+    """
+
+    fields = ['entities', 'updates', 'calls', 'time']
+
+    def __init__(self, enabled=False, history=300, bins=None):
+        """
+        Constructor.
+
+        :param enabled: Whether systems should be instrumented.
+        :param history: Amount of frames to keep statistics for.
+        :param bins: Upper bounds of the histogram bins for time per frame, in ms. Times exceeding
+                     the last bound are counted in an additional bin.
+
+        """
+        self.enabled = enabled
+        self.bins = bins or [0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16]
+
+        # Pairs of frame time and statistics per system, for each recorded frame
+        self.frames = deque(maxlen=history)
+        self.frame = {}
+
+        # Time spent in nested profiled handlers, for every profiled handler which is currently running
+        self.child_times = []
+
+    def on_tick(self, event):
+        """Handle a tick, finishing the current frame and starting a new one."""
+        self.frames.append([event.delta_time, self.frame])
+        self.frame = {}
+
+    def get_current_stats(self, name):
+        """Return the statistics of the current frame for a system, creating them if needed."""
+        stats = self.frame.get(name, None)
+
+        if not stats:
+            stats = self.frame[name] = dict.fromkeys(self.fields, 0)
+
+        return stats
+
+    def instrument(self, system):
+        """
+        Instrument a system.
+
+        Event handlers and the update method of the system are replaced with profiled versions.
+
+        :param system: System to instrument.
+
+        """
+        handlers = set(['on_event', 'on_entity_event'] + [x[0] for x in system.event_handlers.values()])
+
+        for handler in handlers:
+            setattr(system, handler, self.profile_handler(system, handler, getattr(system, handler)))
+
+        system.update = self.profile_update(system, system.update)
+
+    def profile_handler(self, system, handler_name, handler):
+        """Wrap an event handler of a system in order to record entity counts and timing."""
+        @functools.wraps(handler)
+        def profiled_handler(event):
+            stats = self.get_current_stats(system.name)
+
+            self.child_times.append(0)
+            start = time.perf_counter()
+
+            try:
+                if handler_name == 'on_event':
+                    stats['entities'] += len(system.find_entities())
+                elif handler_name == 'on_entity_event':
+                    stats['entities'] += 1 if system.entities.find_entity_by_id_and_components(
+                        event.entity_id, system.requirements) else 0
+
+                return handler(event)
+            finally:
+                elapsed = time.perf_counter() - start
+
+                # Leave out the time spent in nested handlers, and have it left out of the enclosing handler in turn
+                stats['time'] += elapsed - self.child_times.pop()
+                stats['calls'] += 1
+
+                if self.child_times:
+                    self.child_times[-1] += elapsed
+
+        return profiled_handler
+
+    def profile_update(self, system, update):
+        """Wrap the update method of a system in order to count updates."""
+        @functools.wraps(update)
+        def profiled_update(entity, event=None):
+            self.get_current_stats(system.name)['updates'] += 1
+
+            return update(entity, event)
+
+        return profiled_update
+
+    def get_histogram(self, times):
+        """
+        Return the amount of times falling into each histogram bin.
+
+        :param times: Times to count, in ms.
+
+        """
+        histogram = [0] * (len(self.bins) + 1)
+
+        for value in times:
+            histogram[bisect.bisect_left(self.bins, value)] += 1
+
+        return histogram
+
+    def summarize(self, times):
+        """Return the average, maximum and histogram of a list of times per frame, in ms."""
+        frame_count = len(self.frames) or 1
+
+        return {
+            'average_time': sum(times) / frame_count,
+            'max_time': max(times, default=0),
+            'histogram': self.get_histogram(times),
+        }
+
+    def get_stats(self):
+        """
+        Return statistics per system, aggregated over all recorded frames.
+
+        Times are expressed in ms. Frames in which a system wasn't called count as taking no time.
+
+        """
+        frame_count = len(self.frames) or 1
+        names = set([name for frame_time, frame in self.frames for name in frame])
+        stats = {}
+
+        for name in names:
+            frames = [frame[name] for frame_time, frame in self.frames if name in frame]
+            times = [x['time'] * 1000 for x in frames]
+            times += [0] * (len(self.frames) - len(times))
+
+            stats[name] = dict(self.summarize(times), **{
+                'average_entities': sum([x['entities'] for x in frames]) / frame_count,
+                'average_updates': sum([x['updates'] for x in frames]) / frame_count,
+                'average_calls': sum([x['calls'] for x in frames]) / frame_count,
+            })
+
+        return stats
+
+    def get_totals(self):
+        """Return statistics of the total time spent per frame, and of the time spent in systems per frame, in ms."""
+        return {
+            'frame': self.summarize([frame_time * 1000 for frame_time, frame in self.frames]),
+            'systems': self.summarize([sum([x['time'] for x in frame.values()]) * 1000
+                                       for frame_time, frame in self.frames]),
+        }
+
+    def get_bin_labels(self):
+        """Return a label for each histogram bin."""
+        return ['<=%sms' % x for x in self.bins] + ['>%sms' % self.bins[-1]]
+
+    def export(self, path):
+        """
+        Export recorded statistics to a file.
+
+        :param path: Path of the file to export to. The format (JSON or CSV) is determined by its extension.
+
+        """
+        stats = self.get_stats()
+        totals = self.get_totals()
+
+        with open(path, 'w', newline='') as f:
+            if path.lower().endswith('.csv'):
+                fields = ['average_entities', 'average_updates', 'average_calls', 'average_time', 'max_time']
+                writer = csv.writer(f)
+                writer.writerow(['system'] + fields + self.get_bin_labels())
+
+                rows = [['total_%s' % x[0], x[1]] for x in sorted(totals.items())] + sorted(stats.items())
+
+                for name, system_stats in rows:
+                    writer.writerow([name] + [system_stats.get(x, '') for x in fields] + system_stats['histogram'])
+            else:
+                json.dump({'frames': len(self.frames), 'bins': self.bins, 'totals': totals, 'systems': stats},
+                          f, indent=2)
+
+        logger.info('Exported system statistics [path=%s, frames=%s]', path, len(self.frames))
+
+
 class EntityManager(ContainerAware):
 
     """Entity manager."""
@@ -209,6 +411,11 @@ class EntityManager(ContainerAware):
 
         self.entities = {}
         self.entities_components = {}
+        self.dormant_entities = {}
+
+        # Chunks of entities per layer, indexed by chunk coordinates, and the chunk of every chunked entity
+        self.chunks = {}
+        self.entity_chunks = {}
 
         self.components = {}
         self.systems = {}
@@ -216,10 +423,21 @@ class EntityManager(ContainerAware):
         self.component_loader = ModuleLoader(group=self.components_group, instantiate=False)
         self.system_loader = ModuleLoader(group=self.systems_group)
 
+        self.events = self.container.get(EventManager)
+        self.profiler = SystemProfiler(
+            enabled=self.configuration.get('akurra.entities.profiling.enabled', False),
+            history=self.configuration.get('akurra.entities.profiling.history', 300),
+            bins=self.configuration.get('akurra.entities.profiling.histogram_bins', None)
+        )
+        self.profiling_export_path = self.configuration.get('akurra.entities.profiling.export_path', None)
+
         self.load_components()
 
     def start(self):
         """Start."""
+        if self.profiler.enabled:
+            self.events.register(TickEvent, self.profiler.on_tick, 0)
+
         self.system_loader.load()
         self.system_loader.start()
 
@@ -228,6 +446,30 @@ class EntityManager(ContainerAware):
         self.system_loader.stop()
         self.system_loader.unload()
 
+        if self.profiler.enabled:
+            self.events.unregister(self.profiler.on_tick)
+
+            if self.profiling_export_path:
+                self.export_system_stats(os.path.expanduser(self.profiling_export_path))
+
+    def get_system_stats(self):
+        """
+        Return per-system statistics, aggregated over the recorded frames.
+
+        Statistics are only recorded if system profiling is enabled.
+
+        """
+        return self.profiler.get_stats()
+
+    def export_system_stats(self, path):
+        """
+        Export recorded per-system statistics to a JSON or CSV file.
+
+        :param path: Path of the file to export to.
+
+        """
+        self.profiler.export(path)
+
     def load_components(self):
         """Load components."""
         logger.debug('Loading all entity components')
@@ -242,6 +484,9 @@ class EntityManager(ContainerAware):
     def clear_cache(self):
         """Clear various caches."""
         self.__class__.find_entities_by_components.cache.clear()
+        self.__class__.find_active_entities_by_components.cache.clear()
+        self.__class__.find_active_entity_ids_by_components.cache.clear()
+        self.__class__.find_unchunked_entities_by_components.cache.clear()
         self.__class__.find_entity_by_id_and_components.cache.clear()
 
     def add_entity(self, entity):
@@ -253,6 +498,8 @@ class EntityManager(ContainerAware):
         """Remove an entity from the manager."""
         [self.remove_entity_component(entity, entity.components[x]) for x in entity.components]
         self.entities.pop(entity.id, None)
+        self.dormant_entities.pop(entity.id, None)
+        self.unset_entity_chunk(entity)
 
     def add_entity_component(self, entity, component):
         """Add a component to an entity, adding it to the manager."""
@@ -264,6 +511,68 @@ class EntityManager(ContainerAware):
         self.entities_components[component.type].pop(entity.id, None)
         self.clear_cache()
 
+    def clear_activity_cache(self):
+        """Clear caches which depend on entity activity."""
+        self.__class__.find_active_entities_by_components.cache.clear()
+        self.__class__.find_active_entity_ids_by_components.cache.clear()
+        self.__class__.find_unchunked_entities_by_components.cache.clear()
+
+    def sleep_entity(self, entity):
+        """Put an entity to sleep, excluding it from tick-driven queries."""
+        if entity.id not in self.dormant_entities:
+            self.dormant_entities[entity.id] = entity
+            self.clear_activity_cache()
+
+    def wake_entity(self, entity):
+        """Wake up a sleeping entity."""
+        if self.dormant_entities.pop(entity.id, None):
+            self.clear_activity_cache()
+
+    def is_entity_dormant(self, entity):
+        """Check whether an entity is sleeping."""
+        return entity.id in self.dormant_entities
+
+    def set_entity_chunk(self, entity, layer, chunk):
+        """
+        Assign an entity to a chunk of a layer.
+
+        :param entity: Entity to assign.
+        :param layer: Layer the chunk belongs to.
+        :param chunk: Coordinates of the chunk within the layer.
+
+        """
+        current = self.entity_chunks.get(entity.id, None)
+
+        if current == (layer, chunk):
+            return
+
+        if current:
+            self.remove_entity_from_chunk(entity, *current)
+        else:
+            self.__class__.find_unchunked_entities_by_components.cache.clear()
+
+        self.chunks.setdefault(layer, {}).setdefault(chunk, {})[entity.id] = entity
+        self.entity_chunks[entity.id] = (layer, chunk)
+
+    def unset_entity_chunk(self, entity):
+        """Remove an entity from the chunk it is assigned to."""
+        current = self.entity_chunks.pop(entity.id, None)
+
+        if current:
+            self.remove_entity_from_chunk(entity, *current)
+            self.__class__.find_unchunked_entities_by_components.cache.clear()
+
+    def remove_entity_from_chunk(self, entity, layer, chunk):
+        """Remove an entity from a chunk of a layer, cleaning up empty chunks."""
+        entities = self.chunks[layer][chunk]
+        entities.pop(entity.id, None)
+
+        if not entities:
+            self.chunks[layer].pop(chunk, None)
+
+        if not self.chunks[layer]:
+            self.chunks.pop(layer, None)
+
     def find_entity_by_id(self, entity_id):
         """Find an entity by its ID."""
         return self.entities.get(entity_id, None)
@@ -276,6 +585,70 @@ class EntityManager(ContainerAware):
 
         return [self.entities[x] for x in intersection]
 
+    @memoize
+    def find_active_entities_by_components(self, components):
+        """Find entities which are made up of specific components and are not sleeping."""
+        return [x for x in self.find_entities_by_components(components) if x.id not in self.dormant_entities]
+
+    @memoize
+    def find_active_entity_ids_by_components(self, components):
+        """Find the IDs of entities which are made up of specific components and are not sleeping."""
+        return set([x.id for x in self.find_active_entities_by_components(components)])
+
+    @memoize
+    def find_unchunked_entities_by_components(self, components):
+        """Find entities which are made up of specific components, are not sleeping and are not in a chunk."""
+        return [x for x in self.find_active_entities_by_components(components) if x.id not in self.entity_chunks]
+
+    def find_entities_by_cadence(self, components, cadence, tick):
+        """
+        Find entities which are made up of specific components and are due for an update according to a cadence.
+
+        Only chunks within the distance bands that are due for an update are visited, so the cost of this
+        does not depend on the number of entities in chunks further away.
+        Entities which are not in a chunk are always due for an update.
+        Returns a list of [tick interval, entities] pairs.
+
+        :param components: Components entities should be made up of.
+        :param cadence: List of [maximum chunk distance, tick interval] pairs, ordered by distance. Entities in
+                        chunks further away than the last band are never due for an update.
+        :param tick: Index of the current tick.
+
+        """
+        ids = self.find_active_entity_ids_by_components(components)
+        result = [[1, list(self.find_unchunked_entities_by_components(components))]]
+
+        for layer, chunks in self.chunks.items():
+            focus = layer.get_focus_chunk()
+
+            # Without a focus point every chunk is considered nearby
+            if not focus:
+                result[0][1] += [y for x in chunks.values() for y in x.values() if y.id in ids]
+                continue
+
+            previous_distance = -1
+
+            for distance, interval in cadence:
+                if interval and not tick % interval:
+                    entities = []
+
+                    for x in range(focus[0] - distance, focus[0] + distance + 1):
+                        for y in range(focus[1] - distance, focus[1] + distance + 1):
+                            # Skip chunks belonging to previous bands
+                            if max(abs(x - focus[0]), abs(y - focus[1])) <= previous_distance:
+                                continue
+
+                            chunk = chunks.get((x, y), None)
+
+                            if chunk:
+                                entities += [chunk[z] for z in chunk if z in ids]
+
+                    result.append([interval, entities])
+
+                previous_distance = distance
+
+        return result
+
     @memoize
     def find_entity_by_id_and_components(self, entity_id, components):
         """Find an entity by its ID if it is made up of specific components."""
@@ -332,14 +705,98 @@ class Component(ContainerAware):
             self.entity = entity
 
 
+class ComponentStore:
+
+    """
+    Component store.
+
+    Keeps the values of a number of component fields in aligned, contiguous arrays, indexed by slot.
+    This allows systems to process the values of many components in a single batch.
+
+    """
+
+    def __init__(self, fields, typecode='d'):
+        """
+        Constructor.
+
+        :param fields: Names of the fields to store.
+        :param typecode: Array typecode to use for storing values.
+
+        """
+        self.columns = {x: array(typecode) for x in fields}
+        self.free_slots = []
+        self.size = 0
+
+    def allocate(self, component):
+        """
+        Allocate and return a slot for a component.
+
+        The slot is released automatically once the component is garbage collected.
+
+        :param component: Component to allocate a slot for.
+
+        """
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            slot = self.size
+            self.size += 1
+            [x.append(0) for x in self.columns.values()]
+
+        weakref.finalize(component, self.release, slot)
+
+        return slot
+
+    def release(self, slot):
+        """Release a slot, allowing it to be reused."""
+        for column in self.columns.values():
+            column[slot] = 0
+
+        self.free_slots.append(slot)
+
+
 class HealthComponent(Component):
 
     """Health component."""
 
+    # Health values are kept in a shared store to allow for batched processing
+    store = ComponentStore(['min', 'max', 'health'])
+
+    @property
+    def min(self):
+        """Return minimum health."""
+        return self.store.columns['min'][self.slot]
+
+    @min.setter
+    def min(self, value):
+        """Set minimum health."""
+        self.store.columns['min'][self.slot] = value
+
+    @property
+    def max(self):
+        """Return maximum health."""
+        return self.store.columns['max'][self.slot]
+
+    @max.setter
+    def max(self, value):
+        """Set maximum health."""
+        self.store.columns['max'][self.slot] = value
+
+    @property
+    def health(self):
+        """Return health."""
+        return self.store.columns['health'][self.slot]
+
+    @health.setter
+    def health(self, value):
+        """Set health."""
+        self.store.columns['health'][self.slot] = value
+
     def __init__(self, min=0, max=100, health=1, **kwargs):
         """Constructor."""
         super().__init__(**kwargs)
 
+        self.slot = self.store.allocate(self)
         self.min = min
         self.max = max
         self.health = health
@@ -471,27 +928,34 @@ class SpriteComponent(Component):
         self._state = 'stationary'
         self.sprite_size = sprite_size
 
+        # Loaded images are shared, so the sprite works on a copy it can draw onto
         if image:
-            self.image = assets.get_image(image, alpha=True)
+            self.image = assets.get_image(image, alpha=True).copy()
+            assets.add_dependent('image', image, self.reload_images, **get_image_options(alpha=True))
         else:
             self.image = pygame.Surface(self.sprite_size, flags=pygame.HWSURFACE | pygame.SRCALPHA)
 
         self.default_image = self.image.copy()
         self.animations = {}
+        # Sprite sheet paths along with the frames packed from them as [packed frame, blit offset, frame size]
+        self.sprite_sheet_frames = []
         self.rect = self.image.get_rect()
 
+        # Surface owned by the sprite for composing frames which can't be displayed as-is
+        self.canvas = self.image
+        # Frame which was last rendered, used to avoid rendering the same frame again
+        self.rendered_frame = None
+
         if not image:
             for animation in animations:
                 states = animation.get('states', ['stationary_south'])
                 frame_size = animation.get('frame_size', self.sprite_size)
                 render_offset = [(self.sprite_size[0] - frame_size[0]) / 2, (self.sprite_size[1] - frame_size[1]) / 2]
 
-                sprite_sheets = animation['sprite_sheet']
-                sprite_sheets = sprite_sheets if type(sprite_sheets) is list else [sprite_sheets]
-                sprite_sheets = [assets.get_image(x, alpha=True) for x in sprite_sheets]
-
-                sprite_sheet = sprite_sheets[0]
-                [sprite_sheet.blit(x, [0, 0]) for x in sprite_sheets[1:]]
+                sprite_sheet_paths = animation['sprite_sheet']
+                sprite_sheet_paths = sprite_sheet_paths if type(sprite_sheet_paths) is list else [sprite_sheet_paths]
+                sprite_sheet = self.load_sprite_sheet(sprite_sheet_paths)
+                packed_frames = []
 
                 max_frame_count = int(sprite_sheet.get_width() / frame_size[0])
                 frame_count = animation.get('frame_count', max_frame_count)
@@ -502,18 +966,71 @@ class SpriteComponent(Component):
                 loop = animation.get('loop', False)
 
                 for key, state in enumerate(states):
-                    frames = [[pygame.Surface(frame_size, flags=pygame.HWSURFACE | pygame.SRCALPHA), frame_interval]
-                              for x in range(0, frame_count)]
+                    frames = []
 
-                    for i, frame in enumerate(frames):
+                    # Frames are shared between sprites through the texture atlas if it's enabled, otherwise
+                    # each sprite gets its own copy of them
+                    for i in range(0, frame_count):
                         blit_offset = [(i + frame_offset) * frame_size[0], (key + state_offset) * frame_size[1]]
-                        frame[0].blit(sprite_sheet, [0, 0], [blit_offset, frame_size])
+                        frame_key = (tuple(sprite_sheet_paths), tuple(blit_offset), tuple(frame_size))
+                        frame = assets.get_packed_image(frame_key)
+
+                        if not frame:
+                            frame = assets.pack_image(frame_key, sprite_sheet, [blit_offset, frame_size])
+
+                        frames.append([frame, frame_interval])
+                        packed_frames.append([frame, blit_offset, frame_size])
 
                     animator = pyganim.PygAnimation(frames, loop=loop)
                     self.animations[state] = [animator, render_offset]
 
+                self.sprite_sheet_frames.append([sprite_sheet_paths, packed_frames])
+
+            # Frames are refreshed all at once, so register once per sprite sheet
+            for path in set([x for paths, frames in self.sprite_sheet_frames for x in paths]):
+                assets.add_dependent('image', path, self.reload_images, **get_image_options(alpha=True))
+
         super().__init__(**kwargs)
 
+    def load_sprite_sheet(self, sprite_sheet_paths):
+        """Load a sprite sheet, layering multiple sheets onto each other if needed."""
+        assets = self.container.get(AssetManager)
+        sprite_sheets = [assets.get_image(x, alpha=True) for x in sprite_sheet_paths]
+        sprite_sheet = sprite_sheets[0]
+
+        # Loaded images are shared, so sheets are layered onto a copy
+        if len(sprite_sheets) > 1:
+            sprite_sheet = sprite_sheet.copy()
+            [sprite_sheet.blit(x, [0, 0]) for x in sprite_sheets[1:]]
+
+        return sprite_sheet
+
+    def reload_images(self, image):
+        """Refresh the sprite's image or animation frames in place, after one of their source images was reloaded."""
+        assets = self.container.get(AssetManager)
+
+        if not self.sprite_sheet_frames:
+            for surface in [self.default_image, self.canvas]:
+                surface.fill([0, 0, 0, 0])
+                surface.blit(image, [0, 0])
+
+        # Frames are refreshed in place, so sprites sharing them through the texture atlas are refreshed as well
+        for sprite_sheet_paths, packed_frames in self.sprite_sheet_frames:
+            sprite_sheet = self.load_sprite_sheet(sprite_sheet_paths)
+
+            for frame, blit_offset, frame_size in packed_frames:
+                assets.repack_image(frame, sprite_sheet, [blit_offset, frame_size])
+
+        # Make sure the current frame is rendered again
+        self.rendered_frame = None
+
+    def set_image(self, image):
+        """Set the image to display for the sprite."""
+        self.image = image
+
+        if getattr(self, '_entity', None):
+            self._entity.image = image
+
 
 class InputComponent(Component):
 
@@ -591,8 +1108,23 @@ class StateComponent(Component):
 
     """State component."""
 
+    # State flags are kept in a shared store to allow for batched processing
+    store = ComponentStore(['flags'], typecode='l')
+
+    @property
+    def state(self):
+        """Return state."""
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        """Set state."""
+        self._state = value
+        self.store.columns['flags'][self.slot] = value.value
+
     def __init__(self, state=EntityState.NORMAL, **kwargs):
         """Constructor."""
+        self.slot = self.store.allocate(self)
         self.state = state
 
 
@@ -603,14 +1135,32 @@ class System(ContainerAware):
     requirements = []
     event_handlers = {}
 
+    # Whether sleeping entities should be updated when handling events for all entities
+    include_dormant = False
+
+    # Tick update cadence per chunk distance band, as a list of [maximum chunk distance, tick interval]
+    # pairs. Entities in chunks further away than the last band are not updated on ticks.
+    # Can be overridden through configuration.
+    cadence = None
+
     def __init__(self):
         """Constructor."""
+        self.name = snake_case(self.__class__.__name__.replace('System', ''))
         self.events = self.container.get(EventManager)
         self.entities = self.container.get(EntityManager)
 
+        self.cadence = self.container.get(Configuration).get('akurra.entities.systems.%s.cadence' % self.name,
+                                                             self.cadence)
+        self.ticks = 0
+        # Time elapsed since entities updated at each tick interval were last updated, in s
+        self.elapsed_times = {}
+
         # Order requirements, this makes result caching more efficient
         self.requirements.sort()
 
+        if self.entities.profiler.enabled:
+            self.entities.profiler.instrument(self)
+
     def start(self):
         """Start the system."""
         for event, handler in self.event_handlers.items():
@@ -621,11 +1171,44 @@ class System(ContainerAware):
         for handler in self.event_handlers.values():
             self.events.unregister(getattr(self, handler[0]))
 
+    def find_entities(self):
+        """Find and return the entities which should be updated when handling an event for all entities."""
+        if self.include_dormant:
+            return self.entities.find_entities_by_components(self.requirements)
+
+        return self.entities.find_active_entities_by_components(self.requirements)
+
     def on_event(self, event):
         """Handle an event."""
-        for entity in self.entities.find_entities_by_components(self.requirements):
+        if self.cadence and isinstance(event, TickEvent):
+            return self.on_cadenced_tick(event)
+
+        for entity in self.find_entities():
             self.update(entity, event)
 
+    def on_cadenced_tick(self, event):
+        """
+        Handle a tick event, only updating entities which are due for an update according to our cadence.
+
+        Entities which are updated less frequently receive a tick event spanning all the time since their last update.
+
+        """
+        self.ticks += 1
+
+        for distance, interval in self.cadence:
+            if interval:
+                self.elapsed_times[interval] = self.elapsed_times.get(interval, 0) + event.delta_time
+
+        for interval, entities in self.entities.find_entities_by_cadence(self.requirements, self.cadence, self.ticks):
+            interval_event = event if interval == 1 else TickEvent(delta_time=self.elapsed_times[interval])
+
+            for entity in entities:
+                self.update(entity, interval_event)
+
+        for interval in self.elapsed_times:
+            if not self.ticks % interval:
+                self.elapsed_times[interval] = 0
+
     def on_entity_event(self, event):
         """Handle an event which contains a reference to an entity."""
         entity = self.entities.find_entity_by_id_and_components(event.entity_id, self.requirements)
@@ -714,8 +1297,10 @@ class PlayerMouseInputSystem(System):
             pass
 
         # Since this is a mouse action, set the target point for this entity
-        entity.components['input'].input[EntityInput.TARGET_POINT] = \
-            screen_point_to_layer(entity.components['layer'].layer.map_layer, event.original_event['pos'])
+        layer = entity.components['layer'].layer
+        point = layer.display.map_window_point(event.original_event['pos']) if layer.display else \
+            event.original_event['pos']
+        entity.components['input'].input[EntityInput.TARGET_POINT] = screen_point_to_layer(layer.map_layer, point)
 
         # Call the action-specific callback if necessary
         try:
@@ -943,23 +1528,60 @@ class RenderingSystem(System):
         TickEvent: ['on_event', 13]
     }
 
+    def __init__(self):
+        """Constructor."""
+        super().__init__()
+
+        # Ids of visible entities per map layer, found once per tick at the current camera position
+        self.visible_entity_ids = {}
+
+    def on_event(self, event):
+        """Handle an event."""
+        self.visible_entity_ids = {}
+        super().on_event(event)
+
     def update(self, entity, event=None):
         """Have an entity updated by the system."""
         sprite_component = entity.components['sprite']
 
-        try:
-            sprite_component.image.fill([0, 0, 0, 0])
+        # Skip map entities which are out of view. Since animations are time-based, they will
+        # simply continue at the right frame once the entity is visible again
+        if 'map_layer' in entity.components:
+            layer = entity.components['layer'].layer
+
+            if layer not in self.visible_entity_ids:
+                self.visible_entity_ids[layer] = layer.find_visible_entity_ids()
 
-            state_string = '%s_%s' % (sprite_component._state, sprite_component._direction)
-            animation = sprite_component.animations[state_string]
+            if entity.id not in self.visible_entity_ids[layer]:
+                return
 
+        state_string = '%s_%s' % (sprite_component._state, sprite_component._direction)
+        animation = sprite_component.animations.get(state_string, None)
+
+        if animation:
             # Start animations that haven't been started yet
             if not animation[0]._playingStartTime:
                 animation[0].play()
 
-            sprite_component.image.blit(animation[0].getCurrentFrame(), animation[1])
-        except KeyError:
-            sprite_component.image.blit(sprite_component.default_image, [0, 0])
+            frame = animation[0].getCurrentFrame()
+            render_offset = animation[1]
+        else:
+            frame = sprite_component.default_image
+            render_offset = [0, 0]
+
+        # Skip rendering if the frame didn't change since it was last rendered
+        if frame is sprite_component.rendered_frame:
+            return
+
+        sprite_component.rendered_frame = frame
+
+        # Frames which fit the sprite exactly can be displayed as-is, others need to be composed first
+        if not any(render_offset) and frame.get_size() == sprite_component.canvas.get_size():
+            sprite_component.set_image(frame)
+        else:
+            sprite_component.canvas.fill([0, 0, 0, 0])
+            sprite_component.canvas.blit(frame, render_offset)
+            sprite_component.set_image(sprite_component.canvas)
 
 
 class SpriteRenderOrderingSystem(System):
@@ -1059,19 +1681,11 @@ class PlayerTerrainSoundSystem(System):
 
     def update(self, entity, event=None):
         """Have an entity updated by the system."""
-        # Fetch the current tile the player is walking on, based on the current map location
-        coords = [int(x) for x in entity.components['position'].map_position]
+        # Fetch the terrain type the player is walking on, based on the current map location
+        terrain_type = entity.components['layer'].layer.get_terrain_type(entity.components['position'].map_position)
 
-        for i, l in enumerate(entity.components['layer'].layer.map_data.tmx.visible_layers):
-            if l.properties.get('terrain', 'false') == 'true':
-                try:
-                    tile = entity.components['layer'].layer.map_data.tmx.get_tile_properties(coords[0], coords[1], i)
-
-                    if tile and tile.get('terrain_type'):
-                        self.audio.play_sound('terrain_%s' % tile.get('terrain_type'), channel='terrain', queue=False)
-                except KeyError:
-                    # If no tile was found on this layer, that's too bad but we can continue regardless
-                    pass
+        if terrain_type:
+            self.audio.play_sound('terrain_%s' % terrain_type, channel='terrain', queue=False)
 
 
 class ManaGatheringSystem(System):
@@ -1215,23 +1829,129 @@ class HealthRegenerationSystem(System):
         self.default_regeneration_amount = \
             self.cfg.get('akurra.entities.systems.health_regeneration.default_regeneration_amount', 1)
 
+        self.batch = None
+        self.health_slots = array('l')
+        self.state_slots = array('l')
+
+    def on_event(self, event):
+        """Handle an event, regenerating the health of all entities in a single pass over the component arrays."""
+        entities = self.find_entities()
+
+        # Query results are cached until the entities or their components change, so we only
+        # need to rebuild our slot indexes when we get a different result
+        if entities is not self.batch:
+            self.batch = entities
+            self.health_slots = array('l', [x.components['health'].slot for x in entities])
+            self.state_slots = array('l', [x.components['state'].slot for x in entities])
+
+        health = HealthComponent.store.columns['health']
+        maximum = HealthComponent.store.columns['max']
+        flags = StateComponent.store.columns['flags']
+
+        regeneration_amount = self.default_regeneration_amount * event.delta_time
+        regeneration_flag = EntityState.CAN_REPLENISH_HEALTH.value
+
+        for health_slot, state_slot in zip(self.health_slots, self.state_slots):
+            current = health[health_slot]
+
+            # Skip entities which aren't allowed to replenish health or are at full health
+            if not flags[state_slot] & regeneration_flag or current >= maximum[health_slot]:
+                continue
+
+            # If adding would result in exceeding the max amount, only give the entity as much as we can
+            health[health_slot] = min(current + regeneration_amount, maximum[health_slot])
+
+
+class PartitioningSystem(System):
+
+    """System for assigning entities to the chunks of their layer as they move."""
+
+    requirements = [
+        'position',
+        'layer',
+        'map_layer'
+    ]
+
+    event_handlers = {
+        EntityMoveEvent: ['on_entity_event', 16]
+    }
+
     def update(self, entity, event=None):
         """Have an entity updated by the system."""
-        if not entity.components['state'].state.value & EntityState.CAN_REPLENISH_HEALTH.value:
+        entity.components['layer'].layer.update_entity_chunk(entity)
+
+
+class ActivitySystem(System):
+
+    """
+    Activity system.
+
+    Puts entities which are located too far away from the center of their layer (usually the player)
+    to sleep, and wakes them up again once they get close or when they are involved in an event.
+
+    """
+
+    requirements = [
+        'position',
+        'layer',
+        'map_layer'
+    ]
+
+    event_handlers = {
+        TickEvent: ['on_event', 5],
+        EntityHealthChangeEvent: ['on_entity_wake_event', 5],
+        EntityStateChangeEvent: ['on_entity_wake_event', 5],
+        EntityCollisionEvent: ['on_entity_wake_event', 5]
+    }
+
+    include_dormant = True
+
+    def __init__(self):
+        """Constructor."""
+        super().__init__()
+        self.cfg = self.container.get(Configuration)
+
+        self.radius = self.cfg.get('akurra.entities.systems.activity.radius', 1600)
+        self.interval = self.cfg.get('akurra.entities.systems.activity.interval', 0.5)
+        self.elapsed = self.interval
+
+    def on_event(self, event):
+        """Handle an event, checking entity activity at a fixed interval."""
+        self.elapsed += event.delta_time
+
+        if self.elapsed < self.interval:
             return
 
-        health_component = entity.components['health']
+        self.elapsed = 0
+        super().on_event(event)
 
-        # Skip this entity if we're at full health
-        if health_component.health == health_component.max:
+    def on_entity_wake_event(self, event):
+        """Handle an event which should wake up the entities involved."""
+        for entity_id in [event.entity_id, getattr(event, 'collided_entity_id', None)]:
+            entity = self.entities.find_entity_by_id(entity_id) if entity_id else None
+
+            if entity:
+                self.entities.wake_entity(entity)
+
+    def update(self, entity, event=None):
+        """Have an entity updated by the system."""
+        center = entity.components['layer'].layer.center
+
+        # Without a center there is nothing to measure distance from, so everything stays awake
+        if not center:
+            self.entities.wake_entity(entity)
             return
 
-        regeneration_amount = self.default_regeneration_amount * event.delta_time
-        health_component.health += regeneration_amount
+        position = entity.components['position'].layer_position
+        center_position = center.components['position'].layer_position
 
-        # If adding would result in exceeding the max amount, only give the entity as much as we can
-        if health_component.health >= health_component.max:
-            health_component.health = health_component.max
+        distance_x = position[0] - center_position[0]
+        distance_y = position[1] - center_position[1]
+
+        if (distance_x ** 2 + distance_y ** 2) > self.radius ** 2:
+            self.entities.sleep_entity(entity)
+        else:
+            self.entities.wake_entity(entity)
 
 
 class DeathSystem(System):
@@ -4,5 +4,6 @@ from injector import Key
 # General shared flags and objects
 ShutdownFlag = Key('ShutdownFlag')
 DebugFlag = Key('DebugFlag')
+HeadlessFlag = Key('HeadlessFlag')
 DisplayClock = Key('DisplayClock')
 Configuration = Key('Configuration')
@@ -0,0 +1,653 @@
+"""Maps module."""
+import os
+import sys
+import logging
+import pickle
+import hashlib
+import argparse
+import pygame
+import pytmx
+from array import array
+from collections import OrderedDict
+
+from .pixels import PixelCache, get_pixel_cache_key
+
+
+logger = logging.getLogger(__name__)
+
+
+class TerrainMap:
+
+    """
+    Terrain map.
+
+    A compact grid containing one small integer terrain code per tile, allowing for terrain
+    lookups without having to go through map layers and tile properties.
+    Code 0 is reserved for tiles without a terrain type.
+
+    """
+
+    def __init__(self, width, height):
+        """
+        Constructor.
+
+        :param width: Width of the map, in tiles.
+        :param height: Height of the map, in tiles.
+
+        """
+        self.width = width
+        self.height = height
+
+        self.codes = array('B', bytes(width * height))
+        self.terrain_types = [None]
+        self.terrain_codes = {}
+
+    def get_terrain_code(self, terrain_type):
+        """
+        Return the code for a terrain type, registering the type if needed.
+
+        :param terrain_type: Name of the terrain type.
+
+        """
+        code = self.terrain_codes.get(terrain_type, None)
+
+        if code is None:
+            code = len(self.terrain_types)
+
+            if code > 255:
+                raise ValueError('A terrain map cannot contain more than 255 terrain types!')
+
+            self.terrain_types.append(terrain_type)
+            self.terrain_codes[terrain_type] = code
+
+        return code
+
+    def get_code(self, x, y):
+        """Return the terrain code for a tile, or 0 if the tile is out of bounds."""
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return 0
+
+        return self.codes[y * self.width + x]
+
+    def get_type(self, x, y):
+        """Return the terrain type for a tile, or None if the tile has no terrain type."""
+        return self.terrain_types[self.get_code(x, y)]
+
+    def set_type(self, x, y, terrain_type):
+        """Set the terrain type for a tile."""
+        self.codes[y * self.width + x] = self.get_terrain_code(terrain_type) if terrain_type else 0
+
+
+def build_terrain_map(tmx):
+    """
+    Build and return a terrain map based on TMX data.
+
+    Terrain types are merged across all visible terrain layers, with the first layer
+    defining a terrain type for a tile taking precedence.
+
+    :param tmx: TMX data to process.
+
+    """
+    terrain_map = TerrainMap(tmx.width, tmx.height)
+    codes = terrain_map.codes
+    width = terrain_map.width
+
+    for layer in tmx.visible_layers:
+        # Only continue for terrain layers
+        if layer.properties.get('terrain', 'false') != 'true':
+            continue
+
+        # Resolve terrain codes once per GID instead of once per tile
+        gid_codes = {}
+
+        for x, y, gid in layer.iter_data():
+            if not gid or codes[y * width + x]:
+                continue
+
+            if gid not in gid_codes:
+                tile = tmx.get_tile_properties_by_gid(gid)
+                terrain_type = tile.get('terrain_type') if tile else None
+                gid_codes[gid] = terrain_map.get_terrain_code(terrain_type) if terrain_type else 0
+
+            codes[y * width + x] = gid_codes[gid]
+
+    return terrain_map
+
+
+def build_collision_rects(tmx):
+    """
+    Build and return a list of collision rects, as [x, y, width, height], based on TMX data.
+
+    :param tmx: TMX data to process.
+
+    """
+    return [[o.x, o.y, o.width, o.height] for o in tmx.objects if o.properties.get('collision', 'false') == 'true']
+
+
+def build_mana_map(tmx):
+    """
+    Build and return a mana map based on TMX data.
+
+    Mana stores are indexed by layer, x and y coordinates and mana type, with every store
+    consisting of [<current_stores>, <max_stores>].
+
+    :param tmx: TMX data to process.
+
+    """
+    mana_map = {}
+
+    # Loop through all vibible layers
+    for i, l in enumerate(tmx.visible_layers):
+        # Only continue for terrain layers
+        if l.properties.get('terrain', 'false') == 'true':
+            # Iterate over all tiles
+            for x in range(0, l.width):
+                for y in range(0, l.height):
+                    tile = tmx.get_tile_properties(x, y, i)
+
+                    # Only continue if the current tile has mana types
+                    if tile and tile.get('mana_types'):
+                        # Parse mana type data
+                        mana_types = tile['mana_types'].split(';')
+                        mana_types = [x.split(':') for x in mana_types]
+
+                        # Index mana types by type, and use defaults
+                        for mana in mana_types:
+                            mana_map.setdefault(i, {}).setdefault(x, {}).setdefault(y, {})[mana[0]] = [
+                                float(mana[1]) if len(mana) > 1 else 1,
+                                float(mana[2]) if len(mana) > 2 else (float(mana[1] if len(mana) > 1 else 1))
+                            ]
+
+    return mana_map
+
+
+def compact_tile_layers(tmx):
+    """
+    Store the tile grids of TMX data as rows of integer arrays instead of lists.
+
+    Arrays take up less memory and are much faster to serialize, while still being indexable the same way.
+
+    :param tmx: TMX data to process.
+
+    """
+    for layer in tmx.layers:
+        if isinstance(layer, pytmx.TiledTileLayer):
+            layer.data = [array('I', x) for x in layer.data]
+
+
+def get_external_tileset_paths(path, node):
+    """
+    Return the paths of the external (TSX) tilesets referenced by a TMX map.
+
+    pytmx doesn't keep track of these, so they are read from the map's XML instead.
+
+    :param path: Path to the TMX map.
+    :param node: Root element of the TMX map.
+
+    """
+    directory = os.path.dirname(path)
+
+    return [os.path.normpath(os.path.join(directory, x.get('source'))) for x in node.findall('tileset')
+            if x.get('source')]
+
+
+def get_map_source_paths(tmx):
+    """Return the paths of the files a TMX map was loaded from, being the map itself, its tilesets and their images."""
+    directory = os.path.dirname(tmx.filename)
+
+    return [tmx.filename] + getattr(tmx, 'external_tilesets', []) + \
+        [os.path.normpath(os.path.join(directory, x.source)) for x in tmx.tilesets if x.source]
+
+
+class CompiledMap:
+
+    """
+    Compiled map.
+
+    TMX data along with the data derived from it, such as collision rects, mana stores and terrain types,
+    so deriving these only needs to happen once per version of a map.
+    Compiled maps are shared, so their mutable parts should be copied before being modified.
+
+    """
+
+    def __init__(self, tmx):
+        """
+        Constructor.
+
+        :param tmx: TMX data of the map.
+
+        """
+        self.tmx = tmx
+
+        self.collision_rects = build_collision_rects(tmx)
+        self.mana_map = build_mana_map(tmx)
+        self.terrain_map = build_terrain_map(tmx)
+
+
+def create_tiled_element(cls):
+    """Create an empty pytmx element, for unpickling it."""
+    return cls.__new__(cls)
+
+
+def restore_tiled_element(element, state):
+    """Restore the state of an unpickled pytmx element."""
+    element.__dict__.update(state)
+
+
+class CompiledMapPickler(pickle.Pickler):
+
+    """
+    Pickler for compiled maps.
+
+    pytmx elements resolve unknown attributes through their properties, which recurses infinitely when
+    the default unpickling process looks up attributes before any state is restored. Their state is
+    therefore restored directly.
+
+    """
+
+    def reducer_override(self, obj):
+        """Return how to pickle pytmx elements, or NotImplemented for anything else."""
+        if isinstance(obj, pytmx.TiledElement):
+            # Object groups are lists of objects as well
+            items = iter(obj) if isinstance(obj, list) else None
+
+            return (create_tiled_element, (type(obj),), obj.__dict__, items, None, restore_tiled_element)
+
+        return NotImplemented
+
+
+class CompiledMapCache:
+
+    """
+    Compiled map cache.
+
+    Stores compiled maps on disk without their images, along with signatures (e.g. modification time and size)
+    of the files they were loaded from. A compiled map is only used if none of these files changed since.
+    Compiled maps are kept per cache format version, pytmx version and pickle protocol, as they can't be
+    loaded reliably by other versions of either.
+
+    """
+
+    version = 2
+    protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, directory):
+        """
+        Constructor.
+
+        :param directory: Cache directory to use.
+
+        """
+        self.directory = os.path.join(os.path.expanduser(directory), 'compiled_maps')
+        self.full_version = [self.version, '.'.join(str(x) for x in pytmx.__version__), self.protocol]
+
+    def get_path(self, path):
+        """Return the path to the compiled version of a map."""
+        key = '%s:%s' % (os.path.abspath(path), self.full_version)
+
+        return os.path.join(self.directory, '%s.pickle' % hashlib.sha1(key.encode()).hexdigest())
+
+    def load(self, path, get_signature):
+        """
+        Return a compiled map without images, or None if it wasn't cached or is outdated.
+
+        Images can be loaded by setting an image loader on the map's TMX data and reloading its images.
+
+        :param path: Path to the TMX map.
+        :param get_signature: Function returning the signature of a file.
+
+        """
+        try:
+            with open(self.get_path(path), 'rb') as f:
+                version, signatures, compiled_map = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A truncated or otherwise unreadable compiled map is simply compiled again
+            logger.warning('Unable to load compiled map for "%s": %s', path, e)
+            return None
+
+        try:
+            if version != self.full_version or [get_signature(x) for x in signatures] != list(signatures.values()):
+                return None
+        except OSError:
+            return None
+
+        return compiled_map
+
+    def save(self, path, compiled_map, signatures):
+        """
+        Store a compiled map, leaving out its images.
+
+        :param path: Path to the TMX map.
+        :param compiled_map: Compiled map to store.
+        :param signatures: Signatures of the files the map was loaded from, by path.
+
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        tmx = compiled_map.tmx
+        images, image_loader = tmx.images, tmx.image_loader
+        cache_path = self.get_path(path)
+        temporary_path = '%s.%s.tmp' % (cache_path, os.getpid())
+
+        try:
+            tmx.images, tmx.image_loader = [], None
+
+            with open(temporary_path, 'wb') as f:
+                CompiledMapPickler(f, protocol=self.protocol).dump([self.full_version, signatures, compiled_map])
+        finally:
+            tmx.images, tmx.image_loader = images, image_loader
+
+        os.replace(temporary_path, cache_path)
+
+
+def get_map_cache_key(tmx, *args):
+    """
+    Return a key identifying the contents of a TMX map and its tilesets, for caching data derived from them.
+
+    :param tmx: TMX data of the map.
+    :param args: Additional values the cached data depends on.
+
+    """
+    digest = hashlib.sha1()
+    directory = os.path.dirname(tmx.filename)
+    paths = [tmx.filename] + [os.path.join(directory, x.source) for x in tmx.tilesets if x.source]
+
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+
+    digest.update(repr(args).encode())
+
+    return digest.hexdigest()
+
+
+class MapChunkCache:
+
+    """
+    Map chunk cache.
+
+    Stores pre-rendered map chunks on disk through a pixel cache, as raw pixels in the display's pixel format,
+    so loading a chunk takes a single read instead of decoding an image or rendering its tiles.
+
+    """
+
+    def __init__(self, directory, key):
+        """
+        Constructor.
+
+        :param directory: Cache directory to use.
+        :param key: Key identifying the map version, see get_map_cache_key().
+
+        """
+        self.pixel_cache = PixelCache(directory)
+        self.directory = self.pixel_cache.directory
+        self.key = key
+
+    def get_key(self, chunk, part):
+        """Return the pixel cache key for a part of a chunk, in the display's pixel format."""
+        display = pygame.display.get_surface()
+
+        return get_pixel_cache_key(self.key.encode(), chunk[0], chunk[1], part, display.get_bitsize(),
+                                   display.get_masks())
+
+    def load(self, chunk):
+        """Return a pre-rendered chunk as [under surface, over surface], or None if it wasn't cached."""
+        under = self.pixel_cache.load(self.get_key(chunk, 'under'))
+
+        if not under:
+            return None
+
+        return [under, self.pixel_cache.load(self.get_key(chunk, 'over'))]
+
+    def save(self, chunk, under, over):
+        """Store a pre-rendered chunk."""
+        # The under surface marks a chunk as cached, so it is stored last
+        if over:
+            self.pixel_cache.save(self.get_key(chunk, 'over'), over)
+
+        self.pixel_cache.save(self.get_key(chunk, 'under'), under)
+
+
+class ChunkedMapRenderer:
+
+    """
+    Chunked map renderer.
+
+    Renders a TMX map by splitting it into fixed-size chunks of tiles, which are pre-rendered lazily
+    when they come close to the camera. Rendered chunks are kept in an LRU cache limited by a memory budget,
+    so memory usage and render setup time scale with the view instead of the entire map.
+
+    Every chunk consists of a surface containing the tile layers sprites are drawn over, and
+    (if needed) a surface containing the tile layers sprites are drawn under.
+
+    If a chunk cache is provided, chunks are loaded from it instead of being rendered, and chunks
+    without animated tiles are stored in it after rendering.
+
+    This renderer implements the parts of the pyscroll renderer interface used by the engine,
+    so it can be used by map layers and PyscrollGroup in its place.
+
+    """
+
+    def __init__(self, tmx, size, chunk_size=16, sprite_layer=0, memory_budget=64, prefetch=1,
+                 clamp_camera=True, cache=None):
+        """
+        Constructor.
+
+        :param tmx: TMX data of the map to render.
+        :param size: Size of the view, in pixels.
+        :param chunk_size: Size of a single chunk, in tiles.
+        :param sprite_layer: Index of the tile layer sprites are drawn on.
+        :param memory_budget: Maximum amount of memory to use for rendered chunks, in MB.
+        :param prefetch: Amount of chunks around the view to pre-render.
+        :param clamp_camera: Whether or not to prevent the camera from showing what lies beyond the map edges.
+        :param cache: Map chunk cache to use, if any.
+
+        """
+        self.data = tmx
+        self.chunk_size = chunk_size
+        self.sprite_layer = sprite_layer
+        self.memory_budget = memory_budget * 1024 * 1024
+        self.prefetch = prefetch
+        self.clamp_camera = clamp_camera
+        self.cache = cache
+
+        self.animated_gids = set([gid for gid, x in tmx.tile_properties.items() if x and x.get('frames')])
+        self.tile_layers = [[i, x] for i, x in enumerate(tmx.visible_layers) if hasattr(x, 'data')]
+        self.map_rect = pygame.Rect(0, 0, tmx.width * tmx.tilewidth, tmx.height * tmx.tileheight)
+        self.chunk_pixel_size = [chunk_size * tmx.tilewidth, chunk_size * tmx.tileheight]
+
+        # Rendered chunks by chunk coordinates as [under surface, over surface, size in bytes], least recent first
+        self.chunks = OrderedDict()
+        self.memory_usage = 0
+
+        # Pyscroll compatibility: there is no intermediate buffer
+        self.buffer = None
+
+        self.camera = pygame.Rect(0, 0, 0, 0)
+        self.set_size(size)
+
+    @property
+    def view(self):
+        """Return the area of the map in view, in tiles."""
+        tile_width = self.data.tilewidth
+        tile_height = self.data.tileheight
+
+        return pygame.Rect(self.camera.left // tile_width, self.camera.top // tile_height,
+                           self.camera.width // tile_width + 1, self.camera.height // tile_height + 1)
+
+    @property
+    def xoffset(self):
+        """Return the horizontal offset of the camera within its leftmost tile, in pixels."""
+        return self.camera.left % self.data.tilewidth
+
+    @property
+    def yoffset(self):
+        """Return the vertical offset of the camera within its topmost tile, in pixels."""
+        return self.camera.top % self.data.tileheight
+
+    def set_size(self, size):
+        """Set the size of the view, in pixels."""
+        center = self.camera.center
+        self.camera.size = size
+        self.center(center)
+
+    def center(self, point):
+        """Center the camera on a point, in map pixels."""
+        self.camera.center = [round(point[0]), round(point[1])]
+
+        if self.clamp_camera:
+            self.camera.clamp_ip(self.map_rect)
+
+    def get_center_offset(self):
+        """Return the offset to convert map pixels to screen pixels with."""
+        return -self.camera.left, -self.camera.top
+
+    def get_chunks_in_view(self, margin=0):
+        """Return the coordinates of all chunks in view, optionally including a margin of chunks around it."""
+        left = self.camera.left // self.chunk_pixel_size[0] - margin
+        top = self.camera.top // self.chunk_pixel_size[1] - margin
+        right = (self.camera.right - 1) // self.chunk_pixel_size[0] + margin
+        bottom = (self.camera.bottom - 1) // self.chunk_pixel_size[1] + margin
+
+        max_x = (self.data.width - 1) // self.chunk_size
+        max_y = (self.data.height - 1) // self.chunk_size
+
+        return [(x, y) for y in range(max(0, top), min(max_y, bottom) + 1)
+                for x in range(max(0, left), min(max_x, right) + 1)]
+
+    def get_chunk(self, chunk):
+        """Return a rendered chunk, rendering it if needed."""
+        rendered = self.chunks.get(chunk, None)
+
+        if rendered:
+            self.chunks.move_to_end(chunk)
+        else:
+            rendered = self.chunks[chunk] = self.render_chunk(chunk)
+            self.memory_usage += rendered[2]
+
+        return rendered
+
+    def render_chunk(self, chunk):
+        """Render (or load) and return a chunk as [under surface, over surface, size in bytes]."""
+        surfaces = self.cache.load(chunk) if self.cache else None
+
+        if surfaces:
+            return surfaces + [self.get_memory_usage(surfaces)]
+
+        tmx = self.data
+        animated = False
+        left = chunk[0] * self.chunk_size
+        top = chunk[1] * self.chunk_size
+        right = min(left + self.chunk_size, tmx.width)
+        bottom = min(top + self.chunk_size, tmx.height)
+        size = [(right - left) * tmx.tilewidth, (bottom - top) * tmx.tileheight]
+
+        under = pygame.Surface(size).convert()
+        over = None
+
+        for index, layer in self.tile_layers:
+            if index > self.sprite_layer and not over:
+                over = pygame.Surface(size, flags=pygame.SRCALPHA).convert_alpha()
+                over.fill([0, 0, 0, 0])
+
+            surface = over if index > self.sprite_layer else under
+
+            for y in range(top, bottom):
+                row = layer.data[y]
+
+                for x in range(left, right):
+                    image = row[x] and tmx.get_tile_image_by_gid(row[x])
+
+                    if image:
+                        surface.blit(image, [(x - left) * tmx.tilewidth, (y - top) * tmx.tileheight])
+                        animated = animated or row[x] in self.animated_gids
+
+        # Chunks containing animated tiles can't be cached, since they will change later on
+        if self.cache and not animated:
+            self.cache.save(chunk, under, over)
+
+        return [under, over, self.get_memory_usage([under, over])]
+
+    def get_memory_usage(self, surfaces):
+        """Return the amount of memory used by a list of surfaces, in bytes."""
+        return sum([x.get_width() * x.get_height() * x.get_bytesize() for x in surfaces if x])
+
+    def bake(self):
+        """Render all chunks of the map, storing them in the cache. Returns the amount of chunks rendered."""
+        max_x = (self.data.width - 1) // self.chunk_size
+        max_y = (self.data.height - 1) // self.chunk_size
+
+        for x in range(0, max_x + 1):
+            for y in range(0, max_y + 1):
+                self.render_chunk((x, y))
+
+        return (max_x + 1) * (max_y + 1)
+
+    def evict_chunks(self, keep):
+        """Evict the least recently used chunks until the memory budget is met, never evicting the ones to keep."""
+        for chunk in list(self.chunks.keys()):
+            if self.memory_usage <= self.memory_budget:
+                break
+
+            if chunk not in keep:
+                self.memory_usage -= self.chunks.pop(chunk)[2]
+
+    def draw(self, surface, rect, surfaces=[]):
+        """
+        Draw the map in view onto a surface, along with sprites.
+
+        :param surface: Surface to draw onto.
+        :param rect: Area of the surface to draw onto.
+        :param surfaces: Sprites to draw, as (image, rect, layer) tuples with rects in screen projection.
+
+        """
+        offset_x, offset_y = self.get_center_offset()
+        offset_x += rect[0]
+        offset_y += rect[1]
+
+        in_view = self.get_chunks_in_view()
+        positions = [[x[0] * self.chunk_pixel_size[0] + offset_x, x[1] * self.chunk_pixel_size[1] + offset_y]
+                     for x in in_view]
+        rendered = [self.get_chunk(x) for x in in_view]
+
+        surface.blits([(x[0], position) for x, position in zip(rendered, positions)], False)
+        surface.blits([(x[0], x[1]) for x in sorted(surfaces, key=lambda x: x[2])], False)
+        surface.blits([(x[1], position) for x, position in zip(rendered, positions) if x[1]], False)
+
+        # Pre-render a single chunk near the view per frame, to avoid stalls when scrolling
+        for chunk in self.get_chunks_in_view(self.prefetch):
+            if chunk not in self.chunks:
+                self.get_chunk(chunk)
+                break
+
+        self.evict_chunks(set(in_view))
+
+
+def main():
+    """Bake the static chunks of one or more maps into the map chunk cache."""
+    parser = argparse.ArgumentParser(description='Pre-render map chunks into the map chunk cache.')
+    parser.add_argument('maps', type=str, nargs='+', help='TMX maps to bake')
+    parser.add_argument('-c', '--cache-directory', type=str, default='~/.cache/akurra', help='cache directory')
+    parser.add_argument('-s', '--chunk-size', type=int, default=16, help='size of a single chunk, in tiles')
+    parser.add_argument('-l', '--sprite-layer', type=int, default=2, help='index of the layer sprites are drawn on')
+    args = parser.parse_args()
+
+    # A display mode is needed for loading and converting images, but it doesn't need to be visible
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.display.init()
+    pygame.display.set_mode([1, 1])
+
+    for path in args.maps:
+        tmx = pytmx.load_pygame(path)
+        cache = MapChunkCache(args.cache_directory, get_map_cache_key(tmx, args.chunk_size, args.sprite_layer))
+        renderer = ChunkedMapRenderer(tmx, [1, 1], chunk_size=args.chunk_size, sprite_layer=args.sprite_layer,
+                                      cache=cache)
+
+        sys.stdout.write('Baked %s chunks of "%s" into "%s"\n' % (renderer.bake(), path, cache.directory))
+
+
+if __name__ == '__main__':
+    main()
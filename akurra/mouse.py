@@ -194,7 +194,7 @@ class MouseModule(Module):
     def on_mouse_motion(self, event):
         """Handle mouse motion."""
         # Set cursor entity position to mouse location
-        self.cursor.components['position'].primary_position = pygame.mouse.get_pos()
+        self.cursor.components['position'].primary_position = self.display.map_window_point(pygame.mouse.get_pos())
 
     def load_cursor(self):
         """Load the mouse cursor."""
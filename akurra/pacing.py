@@ -0,0 +1,112 @@
+"""Pacing module."""
+import time
+import logging
+from collections import deque
+
+
+logger = logging.getLogger(__name__)
+
+
+class FramePacer:
+
+    """
+    Frame pacer.
+
+    Keeps frames at a target rate by measuring how long a frame took and only waiting for
+    whatever remains of the frame budget. The following modes are supported:
+
+    - balanced: sleep for most of the remaining budget, then busy-wait for the final stretch,
+      since sleeps are not precise
+    - low_latency: busy-wait for the entire remaining budget, trading CPU usage for precision
+    - uncapped: never wait, e.g. for benchmarks
+
+    """
+
+    modes = ['balanced', 'low_latency', 'uncapped']
+
+    def __init__(self, max_fps=60, mode='balanced', spin_millis=2, history=300):
+        """
+        Constructor.
+
+        :param max_fps: Target frame rate, with 0 meaning uncapped.
+        :param mode: Pacing mode to use.
+        :param spin_millis: Final stretch of the frame budget to busy-wait for in balanced mode, in ms.
+        :param history: Amount of frames to keep timings for.
+
+        """
+        if mode not in self.modes:
+            raise ValueError('Unknown frame pacing mode "%s"!' % mode)
+
+        self.mode = mode
+        self.max_fps = max_fps
+        self.budget = 1 / max_fps if max_fps and mode != 'uncapped' else 0
+        self.spin_time = spin_millis / 1000
+
+        self.frame_start = None
+        # Time between frame starts and time spent doing actual work, per frame, in s
+        self.frame_times = deque(maxlen=history)
+        self.frame_costs = deque(maxlen=history)
+
+    def wait(self):
+        """
+        Wait for the remainder of the current frame's budget and start a new frame.
+
+        Returns the time which passed since the previous frame started, in s.
+
+        """
+        now = time.perf_counter()
+
+        if self.frame_start is None:
+            self.frame_start = now
+            return 0.0
+
+        self.frame_costs.append(now - self.frame_start)
+
+        if self.budget:
+            deadline = self.frame_start + self.budget
+
+            if self.mode == 'balanced':
+                remaining = deadline - now - self.spin_time
+
+                if remaining > 0:
+                    time.sleep(remaining)
+
+            while time.perf_counter() < deadline:
+                pass
+
+            now = time.perf_counter()
+
+        # Frames which ran over budget are not caught up on, so the next frame starts now
+        delta_time = now - self.frame_start
+        self.frame_start = now
+        self.frame_times.append(delta_time)
+
+        return delta_time
+
+    def get_percentile(self, percentile, values=None):
+        """
+        Return a percentile of recent frame times, in s.
+
+        :param percentile: Percentile to return, between 0 and 100.
+        :param values: Values to use instead of recent frame times.
+
+        """
+        values = sorted(self.frame_times if values is None else values)
+
+        if not values:
+            return 0.0
+
+        return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+    def get_stats(self):
+        """Return statistics about recent frames, with times in ms."""
+        frame_times = list(self.frame_times)
+        frame_costs = list(self.frame_costs)
+
+        return {
+            'fps': len(frame_times) / sum(frame_times) if frame_times and sum(frame_times) else 0.0,
+            'p50': self.get_percentile(50, frame_times) * 1000,
+            'p95': self.get_percentile(95, frame_times) * 1000,
+            'p99': self.get_percentile(99, frame_times) * 1000,
+            'cost': sum(frame_costs) / len(frame_costs) * 1000 if frame_costs else 0.0,
+        }
@@ -0,0 +1,108 @@
+"""Pixels module."""
+import os
+import struct
+import hashlib
+import logging
+import pygame
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_pixel_cache_key(data, *args):
+    """
+    Return a key identifying an image's source along with the pixel format it is converted to.
+
+    :param data: Contents of the image file, or other bytes identifying where the image came from.
+    :param args: Values describing the pixel format.
+
+    """
+    digest = hashlib.sha1(data)
+    digest.update(repr(args).encode())
+
+    return digest.hexdigest()
+
+
+class PixelCache:
+
+    """
+    Pixel cache.
+
+    Stores converted images on disk as raw pixels in the display's pixel format, so they can be loaded
+    with a single read instead of being decoded and converted again.
+
+    """
+
+    # Magic bytes, width, height, pitch, bit size, flags, color masks, whether or not there is a colorkey and colorkey
+    header = struct.Struct('<4s5I4I?4B')
+    magic = b'AKPX'
+
+    def __init__(self, directory):
+        """
+        Constructor.
+
+        :param directory: Cache directory to use.
+
+        """
+        self.directory = os.path.join(os.path.expanduser(directory), 'pixels')
+
+    def get_path(self, key):
+        """Return the path to the pixels of an image."""
+        return os.path.join(self.directory, '%s.px' % key)
+
+    def load(self, key):
+        """
+        Return a converted image, or None if it wasn't cached.
+
+        Damaged cache files (e.g. truncated ones) are treated as if the image wasn't cached.
+
+        """
+        path = self.get_path(key)
+
+        try:
+            return self.read(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning('Unable to load cached pixels from "%s": %s', path, e)
+            return None
+
+    def read(self, path):
+        """Read and return a converted image from a cache file, raising an error if the file is invalid."""
+        with open(path, 'rb') as f:
+            data = f.read(self.header.size)
+
+            if len(data) != self.header.size or data[:len(self.magic)] != self.magic:
+                raise ValueError('not a pixel cache file')
+
+            header = self.header.unpack(data)
+            width, height, pitch, bitsize, flags = header[1:6]
+            image = pygame.Surface([width, height], flags, bitsize, header[6:10])
+
+            # Pixels can only be read straight into the image if its rows are laid out the same way
+            if image.get_pitch() != pitch:
+                raise ValueError('pixel layout mismatch')
+
+            if f.readinto(image.get_buffer()) != pitch * height:
+                raise ValueError('truncated pixel data')
+
+        if header[10]:
+            image.set_colorkey(header[11:])
+
+        return image
+
+    def save(self, key, image):
+        """Store a converted image."""
+        os.makedirs(self.directory, exist_ok=True)
+
+        path = self.get_path(key)
+        temporary_path = '%s.%s.tmp' % (path, os.getpid())
+        colorkey = image.get_colorkey()
+
+        with open(temporary_path, 'wb') as f:
+            f.write(self.header.pack(self.magic, image.get_width(), image.get_height(), image.get_pitch(),
+                                     image.get_bitsize(), image.get_flags() & pygame.SRCALPHA, *image.get_masks(),
+                                     bool(colorkey), *(colorkey or [0, 0, 0, 0])))
+            f.write(image.get_buffer())
+
+        os.replace(temporary_path, path)
@@ -1,6 +1,5 @@
 """States module."""
 import logging
-import pygame
 
 from .display import DisplayLayer, DisplayModule
 from .events import EventManager, TickEvent
@@ -86,7 +85,8 @@ class SplashScreen(GameState):
 
     """Base splash screen game state."""
 
-    def __init__(self, image, next, fade_duration=2, show_duration=4, background_color=[0, 0, 0]):
+    def __init__(self, image, next, fade_duration=2, show_duration=4, background_color=[0, 0, 0], preload=None,
+                 progress_color=[255, 255, 255]):
         """
         Constructor.
 
@@ -94,6 +94,8 @@ class SplashScreen(GameState):
         :param next: Game state to activate after the splash screen is disabled.
         :param fade_duration: Duration (in seconds) the fade animation should last.
         :param show_duration: Duration (in seconds) during which the image should be shown, after fading.
+        :param preload: AssetBatch to wait for before continuing, showing its progress.
+        :param progress_color: Color of the preload progress bar.
 
         """
         super().__init__()
@@ -106,19 +108,24 @@ class SplashScreen(GameState):
         self.states = self.container.get(StateManager)
         self.input = self.container.get(InputModule)
 
-        self.layer = DisplayLayer(flags=pygame.SRCALPHA)
-        self.image = self.assets.get_image(image, alpha=False)
+        self.layer = DisplayLayer(static=True)
+        # The image's alpha is changed while fading, so work on a copy of the shared image
+        self.image = self.assets.get_image(image, alpha=False).copy()
 
         self.next = next
 
         self.fade_duration = fade_duration
         self.show_duration = show_duration
         self.background_color = background_color
+        self.preload = preload
+        self.progress_color = progress_color
 
     def enable(self):
         """Enable the game state."""
         self.fade_counter = 0
         self.show_counter = 0
+        self.alpha_value = None
+        self.progress = None
 
         self.display.add_layer(self.layer)
         self.events.register(TickEvent, self.on_tick)
@@ -141,7 +148,10 @@ class SplashScreen(GameState):
         if alpha_value > 255:
             alpha_value = 510 - alpha_value
 
-        if self.fade_counter > self.fade_duration and self.show_counter < self.show_duration:
+        # Keep showing the image until all preloaded assets are ready
+        preloading = self.preload and not self.preload.done()
+
+        if self.fade_counter > self.fade_duration and (self.show_counter < self.show_duration or preloading):
             self.show_counter += event.delta_time
         else:
             self.fade_counter += event.delta_time
@@ -149,9 +159,23 @@ class SplashScreen(GameState):
         if self.fade_counter > (2 * self.fade_duration):
             self.next_state()
 
+        # Only redraw when the image's opacity or the preload progress changed, so the layer can remain cached
+        alpha_value = int(alpha_value)
+        progress = self.preload.progress if self.preload else None
+
+        if alpha_value == self.alpha_value and progress == self.progress:
+            return
+
+        self.alpha_value = alpha_value
+        self.progress = progress
         surface = self.layer.surface
-        surface.fill(self.background_color)
+        self.layer.fill(self.background_color)
 
         self.image.set_alpha(alpha_value)
-        surface.blit(self.image, [(surface.get_width() / 2) - (self.image.get_width() / 2),
-                                  (surface.get_height() / 2) - (self.image.get_height() / 2)])
+        position = [(surface.get_width() / 2) - (self.image.get_width() / 2),
+                    (surface.get_height() / 2) - (self.image.get_height() / 2)]
+        self.layer.blit(self.image, position)
+
+        if preloading:
+            self.layer.fill(self.progress_color, [position[0], position[1] + self.image.get_height() + 16,
+                                                  self.image.get_width() * progress, 4])
@@ -8,7 +8,7 @@ from .locals import *  # noqa
 from .display import DisplayModule, DisplayLayer
 from .events import TickEvent, EventManager
 from .entities import EntityManager, EntityHealthChangeEvent, EntityInput
-from .assets import AssetManager
+from .assets import AssetManager, AssetReloadedEvent
 from .modules import Module
 from .session import SessionManager
 from .utils import map_point_to_screen
@@ -37,11 +37,13 @@ class UIModule(Module):
         self.configuration = self.container.get(Configuration)
 
         self.font = pygame.font.SysFont('monospace', 9)
-        self.layer = DisplayLayer(flags=pygame.SRCALPHA, z_index=140)
+        self.layer = DisplayLayer(flags=pygame.SRCALPHA, z_index=140, static=True)
 
         self.elements = {}
         self.autodraw_elements = []
         self.health_bar_entities = {}
+        self.health_bars_visible = False
+        self.ui_scope_variables = None
 
         self.health_bar_display_time = self.configuration.get('akurra.ui.health_bar.display_time', 5)
         self.element_configs = self.configuration.get('akurra.ui.elements', {})
@@ -63,11 +65,7 @@ class UIModule(Module):
                 element = parent
 
             if element.get('image', None):
-                element['image'] = self.assets.get_image(element['image'], alpha=True)
-
-                if element.get('resize', None):
-                    element['image'] = pygame.transform.smoothscale(element['image'], element['resize'])
-                    element.pop('resize', None)
+                element['image'] = self.assets.get_atlas_image(element['image'], element.pop('resize', None))
 
             if element.get('position', None):
                 if element.get('relative_position', None):
@@ -100,27 +98,29 @@ class UIModule(Module):
         self.display.add_layer(self.layer)
         self.events.register(TickEvent, self.on_tick)
         self.events.register(EntityHealthChangeEvent, self.on_entity_health_change)
+        self.events.register(AssetReloadedEvent, self.on_asset_reloaded)
 
     def stop(self):
         """Stop the module."""
+        self.events.unregister(self.on_asset_reloaded)
         self.events.unregister(self.on_entity_health_change)
         self.events.unregister(self.on_tick)
         self.display.remove_layer(self.layer)
 
-    def render_player_ui(self, player):
-        """Render player ui elements."""
+    def get_ui_scope_variables(self, player):
+        """Return the variables available to ui elements."""
         player_health = player.components['health']
         player_mana = player.components['mana']
         player_character = player.components['character']
         player_input = player.components['input']
 
-        self.ui_scope_variables = {
+        ui_scope_variables = {
             'player_mana_earth': math.floor(player_mana.mana.get('earth', 0)),
             'player_mana_water': math.floor(player_mana.mana.get('water', 0)),
             'player_mana_fire': math.floor(player_mana.mana.get('fire', 0)),
             'player_mana_air': math.floor(player_mana.mana.get('air', 0)),
             'player_current_health': math.floor(player_health.health),
-            'player_max_health': player_health.max,
+            'player_max_health': math.floor(player_health.max),
             'player_current_health_percentage': (player_health.health * 100) / player_health.max,
             'player_character_name': player_character.name,
 
@@ -135,13 +135,16 @@ class UIModule(Module):
             target_health = target_entity.components['health']
             target_character = target_entity.components['character']
 
-            self.ui_scope_variables['target_character_name'] = target_character.name
-            self.ui_scope_variables['target_current_health'] = math.floor(target_health.health)
-            self.ui_scope_variables['target_max_health'] = target_health.max
-            self.ui_scope_variables['target_current_health_percentage'] = \
+            ui_scope_variables['target_character_name'] = target_character.name
+            ui_scope_variables['target_current_health'] = math.floor(target_health.health)
+            ui_scope_variables['target_max_health'] = math.floor(target_health.max)
+            ui_scope_variables['target_current_health_percentage'] = \
                 (target_health.health * 100) / target_health.max
 
-        # self.layer.surface.fill([0, 0, 0, 0])
+        return ui_scope_variables
+
+    def render_player_ui(self):
+        """Render player ui elements."""
         for element in self.autodraw_elements:
             if element.get('visibility_link', None):
                 if not self.ui_scope_variables[element['visibility_link']]:
@@ -153,7 +156,7 @@ class UIModule(Module):
                 if element.get('width_link', None):
                     image_size[2] *= self.ui_scope_variables[element['width_link']] / 100
 
-                self.layer.surface.blit(element['image'], element['position'], image_size)
+                self.layer.blit(element['image'], element['position'], image_size)
 
             if element.get('text', None):
                 text = self.font.render(
@@ -170,12 +173,13 @@ class UIModule(Module):
                 elif text_align == 'right':
                     text_position[0] -= text.get_width()
 
-                self.layer.surface.blit(text, text_position)
+                self.layer.blit(text, text_position)
 
     def render_entity_contexts(self, event):
         """Render data related to entity context such as health bars, character names and the like."""
         health_bar = self.elements['health_bar_small']['image']
         health_bar_width = health_bar.get_width()
+        self.health_bars_visible = bool(self.health_bar_entities)
 
         for entity_id in self.health_bar_entities.copy():
             entity = self.entities.find_entity_by_id(entity_id)
@@ -191,7 +195,7 @@ class UIModule(Module):
             blit_position[0] += padding[0]
             blit_position[1] += padding[1]
 
-            self.layer.surface.blit(health_bar, blit_position, [0, 0, int(health_percentage * health_bar_width), 900])
+            self.layer.blit(health_bar, blit_position, [0, 0, int(health_percentage * health_bar_width), 900])
 
             # Increment static time (time entity's health hasn't changed by event delta time)
             self.health_bar_entities[entity_id] += event.delta_time
@@ -205,6 +209,10 @@ class UIModule(Module):
         """Handle an entity health change event."""
         self.health_bar_entities[event.entity_id] = 0.0
 
+    def on_asset_reloaded(self, event):
+        """Handle an asset reload, redrawing the UI since its images may have changed."""
+        self.ui_scope_variables = None
+
     def on_tick(self, event):
         """Handle a tick."""
         player = self.session.get('player')
@@ -212,6 +220,15 @@ class UIModule(Module):
         if not player:
             return
 
-        self.layer.surface.fill([0, 0, 0, 0])
-        self.render_player_ui(player)
+        ui_scope_variables = self.get_ui_scope_variables(player)
+
+        # Only redraw when something changed, so the layer can remain cached by the display
+        if ui_scope_variables == self.ui_scope_variables and \
+                not self.health_bar_entities and not self.health_bars_visible:
+            return
+
+        self.ui_scope_variables = ui_scope_variables
+
+        self.layer.clear()
+        self.render_player_ui()
         self.render_entity_contexts(event)
@@ -119,6 +119,34 @@ def map_unit_vector_to_angle(unit_vector):
     return math.atan2(unit_vector[1] * math.pi, unit_vector[0] * math.pi)
 
 
+def merge_rects(rects, clip=None):
+    """
+    Merge overlapping rects and return the result.
+
+    :param rects: Rects to merge.
+    :param clip: Optional rect to clip the resulting rects to.
+
+    """
+    merged = []
+
+    for rect in rects:
+        rect = rect.clip(clip) if clip else pygame.Rect(rect)
+
+        if not rect:
+            continue
+
+        # Keep merging until the rect no longer overlaps any of the merged ones
+        index = rect.collidelist(merged)
+
+        while index > -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+
+        merged.append(rect)
+
+    return merged
+
+
 def map_point_to_screen(map_layer, point):
     """Convert a pair of coordinates from a map projection to screen projection."""
     return [point[0] - (map_layer.xoffset + (map_layer.view.left * map_layer.data.tilewidth)),
@@ -29,6 +29,8 @@ setup(
     entry_points={
         'console_scripts': [
             'akurra = akurra:main',
+            'akurra-bake-map = akurra.maps:main',
+            'akurra-pack-assets = akurra.archive:main',
         ],
 
         'akurra.modules': [
@@ -82,6 +84,8 @@ setup(
             'positioning = akurra.entities:PositioningSystem',
             'health_regeneration = akurra.entities:HealthRegenerationSystem',
             'death = akurra.entities:DeathSystem',
+            'activity = akurra.entities:ActivitySystem',
+            'partitioning = akurra.entities:PartitioningSystem',
 
             'skill_usage = akurra.skills:SkillUsageSystem',
             'mana_consuming_skill = akurra.skills:ManaConsumingSkillSystem',